@@ -1,12 +1,32 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from collections import OrderedDict
 from abc import ABC, abstractmethod
-from typing import Dict, Any, ClassVar, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, ClassVar, ContextManager, List, Optional, Sequence, Tuple, TypeVar
+from src.image_cache import load_image
+
+T = TypeVar("T")
 
 class BaseAdapter(ABC):
     dependencies: ClassVar[List[str]] = []
+    # Adapters that only hold a stateless client (HTTP APIs) can serve several
+    # generate_response calls at once; local models must be called one at a time.
+    supports_concurrency: ClassVar[bool] = False
+    # Prefetched preprocessing kept for generate; only exceeded when items fail after prefetching
+    max_prepared: ClassVar[int] = 64
 
     def __init__(self, model_name: str, device: str):
         self.model_name = model_name
         self.device = device
+        self.feature_cache = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # image path -> (preprocess_image result, prefetched uses not yet consumed)
+        self._prepared: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._prepared_lock = threading.Lock()
 
     @classmethod
     @abstractmethod
@@ -17,10 +37,89 @@ class BaseAdapter(ABC):
     async def generate_response(self, question: str, image_path: str) -> str:
         pass
 
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        # Adapters that can run several prompts through one model.generate call override this;
+        # the default keeps the single-item contract.
+        return [
+            await self.generate_response(question, image_path)
+            for question, image_path in zip(questions, image_paths)
+        ]
+
     @abstractmethod
     async def verify(self) -> bool:
         pass
 
+    async def run_blocking(self, func: Callable[..., T], *args: Any) -> T:
+        # Local adapters run preprocessing and model.generate through this so the event loop keeps
+        # serving judge and API requests meanwhile. Each adapter has one dedicated thread, so calls
+        # into its model never overlap; context variables (metrics, feature scope) carry over.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def preprocess_image(self, image_path: str) -> Any:
+        # Adapters whose image preprocessing does not depend on the question return its result here
+        # (e.g. resized and normalised pixel_values) and get it back in generate from
+        # prepared_image. None means decoding is all that can be done ahead of time.
+        return None
+
+    def prefetch_image(self, image_path: str) -> None:
+        # Called from a background thread ahead of generate_response/generate_batch for the same
+        # image. Decodes it into the shared image cache, and runs preprocess_image where the
+        # adapter has one; API adapters override this to warm the encoding they send.
+        prepared = self.preprocess_image(image_path)
+        if prepared is None:
+            load_image(image_path)
+            return
+        with self._prepared_lock:
+            _, uses = self._prepared.get(image_path, (None, 0))
+            self._prepared[image_path] = (prepared, uses + 1)
+            while len(self._prepared) > self.max_prepared:
+                self._prepared.popitem(last=False)
+
+    def prepared_image(self, image_path: str) -> Any:
+        # The prefetched preprocess_image result for one upcoming use of the image, or a fresh one
+        # when it was not prefetched (prefetch disabled, or the item was not in the plan). Later
+        # questions on the same image may get the same object, so callers copy it before changing it.
+        with self._prepared_lock:
+            entry = self._prepared.pop(image_path, None)
+            if entry is not None:
+                prepared, uses = entry
+                if uses > 1:
+                    self._prepared[image_path] = (prepared, uses - 1)
+                return prepared
+        return self.preprocess_image(image_path)
+
+    def enable_feature_cache(self, cache) -> bool:
+        # Local VLM adapters override this to reuse vision-encoder work across questions that share
+        # an image (see src.feature_cache). Returns whether the adapter supports it.
+        return False
+
+    def feature_scope(self, image_paths: Sequence[str], rows: Optional[Sequence[int]] = None) -> ContextManager:
+        # Wrap model.generate in this so cached vision features can be matched to their images
+        if self.feature_cache is None:
+            return contextlib.nullcontext()
+        return self.feature_cache.images(f"{self.model_name}:vision", image_paths, rows)
+
+    def unload(self) -> None:
+        # Drops the model so its memory can be reclaimed while the judge finishes (see run_sweep.py).
+        # The adapter cannot generate afterwards.
+        for name in ("model", "processor", "tokenizer", "feature_cache"):
+            if hasattr(self, name):
+                setattr(self, name, None)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def cache_key(self) -> Dict[str, Any]:
+        # Identifies the adapter when one of its methods is wrapped with src.caching.disk_cache
+        return {
+            "adapter": type(self).__qualname__,
+            "model_name": self.model_name,
+            "config": getattr(self, "config", None),
+        }
+
     @classmethod
     def get_config_schema(cls) -> Dict[str, Any]:
-        return {}
\ No newline at end of file
+        return {}
@@ -1,92 +1,81 @@
-import io
-import base64
+import asyncio
 import os
-import time
-from PIL import Image
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from plugins.base_adapter import BaseAdapter
-from anthropic import Anthropic, InternalServerError
+from src.http_client import get_http_client
+from src.image_cache import DEFAULT_JPEG_MAX_BYTES, get_image_cache
+from src import metrics
+from src.resilience import call_with_retries
+from anthropic import AsyncAnthropic
 
 class ClaudeAdapter(BaseAdapter):
     dependencies = [
         'pillow>=8.0.0',
         'anthropic',
     ]
+    supports_concurrency = True
 
     def __init__(self, model_name: str, device: str, config: Dict[str, Any]):
         super().__init__(model_name, device)
         self.config = config
         self.api_key = os.environ["ANTHROPIC_API_KEY"]
-        self.client = Anthropic(api_key=self.api_key)
+        self._client: Optional[AsyncAnthropic] = None
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        # Created on first use so the client binds to the shared pool of the running event loop
+        if self._client is None:
+            # Retries go through call_with_retries, which shares a circuit breaker with other callers
+            self._client = AsyncAnthropic(api_key=self.api_key, http_client=get_http_client(), max_retries=0)
+        return self._client
 
     @classmethod
     def supports_model(cls, model_name: str) -> bool:
         return model_name.startswith('claude')
 
     async def generate_response(self, question: str, image_path: str) -> str:
-        max_retries = 3
-        retry_delay = 5  # seconds
+        # Encode the image to base64
+        image_data = await asyncio.to_thread(self.encode_image_to_base64, image_path)
 
-        for attempt in range(max_retries):
-            try:
-                # Encode the image to base64
-                image_data = self.encode_image_to_base64(image_path)
-                
-                # Prepare the messages for the API request
-                messages = [
+        # Prepare the messages for the API request
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": question},
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": question},
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": image_data,
-                                },
-                            },
-                        ],
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "image/jpeg",
+                            "data": image_data,
+                        },
                     },
-                ]
-
-                # Make the API request
-                response = self.client.messages.create(
-                    max_tokens=self.config.get('max_length', 1000),
-                    messages=messages,
-                    temperature=self.config.get('temperature', 0.7),
-                    model=self.model_name,
-                )
-
-                # Return the generated response
-                return response.content[0].text
+                ],
+            },
+        ]
 
-            except InternalServerError as e:
-                if attempt < max_retries - 1:
-                    print(f"Internal server error occurred. Retrying in {retry_delay} seconds. (Attempt {attempt + 1}/{max_retries})")
-                    time.sleep(retry_delay)
-                else:
-                    print(f"Max retries reached. Last error: {str(e)}")
-                    raise e
+        # Make the API request
+        response = await call_with_retries(
+            lambda: self.client.messages.create(
+                max_tokens=self.config.get('max_length', 1000),
+                messages=messages,
+                temperature=self.config.get('temperature', 0.7),
+                model=self.model_name,
+            ),
+            str(self.client.base_url),
+            description=f"{self.model_name} request",
+        )
 
-        raise Exception("Maximum number of retries exceeded.")
+        metrics.record(input_tokens=response.usage.input_tokens, output_tokens=response.usage.output_tokens)
+        # Return the generated response
+        return response.content[0].text
 
-    def encode_image_to_base64(self, filepath, max_size=5*1024*1024*3//4):
-        with Image.open(filepath) as img:
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", optimize=True, quality=85)
-            size = buffer.tell()
+    def encode_image_to_base64(self, filepath, max_size=DEFAULT_JPEG_MAX_BYTES):
+        return get_image_cache().jpeg_base64(filepath, max_bytes=max_size, quality=85)
 
-            if size > max_size:
-                quality = 85
-                while size > max_size and quality > 10:
-                    buffer = io.BytesIO()
-                    img.save(buffer, format="JPEG", optimize=True, quality=quality)
-                    size = buffer.tell()
-                    quality -= 5
-            return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    def prefetch_image(self, image_path: str) -> None:
+        self.encode_image_to_base64(image_path)
 
     async def verify(self) -> bool:
         try:
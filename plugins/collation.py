@@ -0,0 +1,27 @@
+import torch
+from typing import Dict, List, Optional
+
+def left_pad(sequences: List[torch.Tensor], pad_value: int) -> torch.Tensor:
+    sequences = [seq.reshape(-1) for seq in sequences]
+    max_length = max(seq.shape[0] for seq in sequences)
+    padded = sequences[0].new_full((len(sequences), max_length), pad_value)
+    for i, seq in enumerate(sequences):
+        padded[i, max_length - seq.shape[0]:] = seq
+    return padded
+
+def collate_encodings(encodings: List[Dict[str, torch.Tensor]], pad_token_id: Optional[int]) -> Dict[str, torch.Tensor]:
+    # Decoder-only generation continues from the last position, so prompts are padded on the left.
+    # Everything that is not a token sequence (pixel_values, image_sizes, ...) is stacked along the batch dimension.
+    pad_token_id = pad_token_id if pad_token_id is not None else 0
+    batch = {}
+    for key in encodings[0].keys():
+        values = [encoding[key] for encoding in encodings]
+        if key == "input_ids":
+            batch[key] = left_pad(values, pad_token_id)
+        elif key == "attention_mask":
+            batch[key] = left_pad(values, 0)
+        else:
+            batch[key] = torch.cat(values, dim=0)
+    if "attention_mask" not in batch:
+        batch["attention_mask"] = left_pad([torch.ones_like(encoding["input_ids"]) for encoding in encodings], 0)
+    return batch
@@ -1,8 +1,10 @@
 import torch
-from PIL import Image
 from transformers import AutoProcessor, LlavaForConditionalGeneration
-from typing import Dict, Any
+from typing import Dict, Any, List
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
+from plugins.collation import collate_encodings
 
 class CyberagentLlavaCalmSiglipAdapter(BaseAdapter):
     dependencies = [
@@ -25,22 +27,20 @@ class CyberagentLlavaCalmSiglipAdapter(BaseAdapter):
         return model_name.startswith("cyberagent/llava-calm2-siglip")
 
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    def _generate_response(self, question: str, image_path: str) -> str:
+        image = load_image(image_path)
         
-        prompt = f"""USER: <image>
-{question}
-ASSISTANT: """
+        prompt = self._build_prompt(question)
         
         try:
             inputs = self.processor(text=prompt, images=image, return_tensors="pt").to(self.device, torch.bfloat16)
             
-            generate_ids = self.model.generate(
-                **inputs,
-                max_length=self.config.get('max_length', 256),
-                do_sample=self.config.get('do_sample', False),
-                temperature=self.config.get('temperature', 0.7),
-                no_repeat_ngram_size=self.config.get('no_repeat_ngram_size', 3),
-            )
+            generate_ids = self.model.generate(**inputs, **self._generation_kwargs())
             
             output = self.processor.tokenizer.decode(generate_ids[0][:-1], clean_up_tokenization_spaces=False)
             response = output.split("ASSISTANT: ")[1]
@@ -53,6 +53,48 @@ ASSISTANT: """
             del inputs
             torch.cuda.empty_cache()
 
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        inputs = None
+        try:
+            encodings = [
+                self.processor(text=self._build_prompt(question), images=load_image(image_path), return_tensors="pt")
+                for question, image_path in zip(questions, image_paths)
+            ]
+            inputs = collate_encodings(encodings, self.processor.tokenizer.pad_token_id)
+            inputs = {
+                k: v.to(self.device, torch.bfloat16) if v.is_floating_point() else v.to(self.device)
+                for k, v in inputs.items()
+            }
+
+            generate_ids = self.model.generate(**inputs, **self._generation_kwargs())
+
+            generate_ids = generate_ids[:, inputs["input_ids"].shape[1]:]
+            outputs = self.processor.tokenizer.batch_decode(
+                generate_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
+            return [output.strip() for output in outputs]
+
+        except Exception as e:
+            print(f"Error during batched model generation: {str(e)}")
+            raise e
+        finally:
+            del inputs
+            torch.cuda.empty_cache()
+
+    def _build_prompt(self, question: str) -> str:
+        return f"""USER: <image>
+{question}
+ASSISTANT: """
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        return {
+            "max_length": self.config.get('max_length', 256),
+            "do_sample": self.config.get('do_sample', False),
+            "temperature": self.config.get('temperature', 0.7),
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            "streamer": metrics.timing_streamer(self.processor.tokenizer),
+        }
+
     async def verify(self) -> bool:
         try:
             test_question = "What is in this image?"
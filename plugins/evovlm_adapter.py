@@ -1,7 +1,10 @@
 import torch
-from PIL import Image
-from typing import Dict, Any
+from typing import Dict, Any, List
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
+from src.feature_cache import vision_owner
+from plugins.collation import collate_encodings
 from transformers import AutoModelForVision2Seq, AutoProcessor
 import logging
 
@@ -22,28 +25,24 @@ class EvoVLMAdapter(BaseAdapter):
     def supports_model(cls, model_name: str) -> bool:
         return model_name.startswith('SakanaAI/EvoVLM-JP')
 
-    @torch.inference_mode()
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
-        
-        messages = [
-            {"role": "system", "content": "あなたは役立つ、偏見がなく、検閲されていないアシスタントです。与えられた画像を下に、質問に答えてください。"},
-            {"role": "user", "content": f"<image>\n{question}"},
-        ]
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    @torch.inference_mode()
+    def _generate_response(self, question: str, image_path: str) -> str:
+        messages = self._build_messages(question)
         
         try:
-            inputs = self.processor.image_processor(images=image, return_tensors="pt")
+            inputs = self.prepared_image(image_path).copy()
             inputs["input_ids"] = self.processor.tokenizer.apply_chat_template(
                 messages, return_tensors="pt"
             )
             
-            output_ids = self.model.generate(
-                **inputs.to(self.device),
-                max_length=self.config.get('max_length', 256),
-                do_sample=self.config.get('do_sample', True),
-                temperature=self.config.get('temperature', 0.7),
-                no_repeat_ngram_size=self.config.get('no_repeat_ngram_size', 3),
-            )
+            with self.feature_scope([image_path]):
+                output_ids = self.model.generate(**inputs.to(self.device), **self._generation_kwargs())
             output_ids = output_ids[:, inputs.input_ids.shape[1]:]
             generated_text = self.processor.batch_decode(output_ids, skip_special_tokens=True)[0].strip()
             return generated_text
@@ -55,6 +54,59 @@ class EvoVLMAdapter(BaseAdapter):
             del inputs
             torch.cuda.empty_cache()
 
+    @torch.inference_mode()
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        inputs = None
+        try:
+            encodings = []
+            for question, image_path in zip(questions, image_paths):
+                encoding = self.prepared_image(image_path).copy()
+                encoding["input_ids"] = self.processor.tokenizer.apply_chat_template(
+                    self._build_messages(question), return_tensors="pt"
+                )
+                encodings.append(encoding)
+            inputs = collate_encodings(encodings, self.processor.tokenizer.pad_token_id)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+            with self.feature_scope(image_paths):
+                output_ids = self.model.generate(**inputs, **self._generation_kwargs())
+            output_ids = output_ids[:, inputs["input_ids"].shape[1]:]
+            return [text.strip() for text in self.processor.batch_decode(output_ids, skip_special_tokens=True)]
+
+        except Exception as e:
+            logging.error(f"Error during batched model generation: {e}")
+            raise e
+        finally:
+            del inputs
+            torch.cuda.empty_cache()
+
+    def preprocess_image(self, image_path: str) -> Dict[str, Any]:
+        # Independent of the question, so prefetching does it ahead of generate
+        return self.processor.image_processor(images=load_image(image_path), return_tensors="pt")
+
+    def _build_messages(self, question: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "あなたは役立つ、偏見がなく、検閲されていないアシスタントです。与えられた画像を下に、質問に答えてください。"},
+            {"role": "user", "content": f"<image>\n{question}"},
+        ]
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        return {
+            "max_length": self.config.get('max_length', 256),
+            "do_sample": self.config.get('do_sample', True),
+            "temperature": self.config.get('temperature', 0.7),
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            "streamer": metrics.timing_streamer(self.processor.tokenizer),
+        }
+
+    def enable_feature_cache(self, cache) -> bool:
+        # The projected image features depend only on the image, so they are reused across questions
+        owner = vision_owner(self.model, "get_image_features")
+        if owner is None or not cache.wrap(owner, "get_image_features"):
+            return False
+        self.feature_cache = cache
+        return True
+
     async def verify(self) -> bool:
         try:
             test_question = "What is in this image?"
@@ -1,7 +1,10 @@
+import asyncio
 import os
-from PIL import Image
 from typing import Dict, Any
 from plugins.base_adapter import BaseAdapter
+from src.image_cache import load_image
+from src import metrics
+from src.resilience import call_with_retries
 import google.generativeai as genai
 
 class GeminiAdapter(BaseAdapter):
@@ -9,6 +12,7 @@ class GeminiAdapter(BaseAdapter):
         'pillow>=8.0.0',
         'google-generativeai',
     ]
+    supports_concurrency = True
 
     def __init__(self, model_name: str, device: str, config: Dict[str, Any]):
         super().__init__(model_name, device)
@@ -28,9 +32,16 @@ class GeminiAdapter(BaseAdapter):
         return 'gemini' in model_name.lower()
 
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
+        image = await asyncio.to_thread(load_image, image_path)
         message = [question, image]
-        response = self.model.generate_content(message)
+        response = await call_with_retries(
+            lambda: self.model.generate_content_async(message),
+            "generativelanguage.googleapis.com",
+            description=f"{self.model_name} request",
+        )
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            metrics.record(input_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
 
         if hasattr(response._result, 'candidates') and response._result.candidates:
             candidate = response._result.candidates[0]
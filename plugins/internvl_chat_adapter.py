@@ -2,6 +2,8 @@ import torch
 from PIL import Image
 from typing import Dict, Any, List
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import get_image_cache
 from transformers import AutoTokenizer, AutoModelForCausalLM, AutoConfig
 from torchvision import transforms as T
 import logging
@@ -65,7 +67,14 @@ class InternVLChatAdapter(BaseAdapter):
         return model_name.startswith("OpenGVLab/InternVL-Chat")
 
     def load_image(self, image_path: str, input_size: int = 448, max_num: int = 6) -> torch.Tensor:
-        image = Image.open(image_path).convert('RGB')
+        if self.feature_cache is not None:
+            # Skip re-tiling images that were already seen with the same settings
+            key = self.feature_cache.key(f"{self.model_name}:tiles", image_path, input_size, max_num)
+            return self.feature_cache.get_or_compute(key, lambda: self._tile_image(image_path, input_size, max_num))
+        return self._tile_image(image_path, input_size, max_num)
+
+    def _tile_image(self, image_path: str, input_size: int, max_num: int) -> torch.Tensor:
+        image = get_image_cache().pil_image(image_path).convert('RGB')
         transform = self.build_transform(input_size=input_size)
         images = self.dynamic_preprocess(image, image_size=input_size, use_thumbnail=True, max_num=max_num)
         pixel_values = [transform(image) for image in images]
@@ -131,22 +140,21 @@ class InternVLChatAdapter(BaseAdapter):
                     best_ratio = ratio
         return best_ratio
 
-    @torch.inference_mode()
     async def generate_response(self, question: str, image_path: str) -> str:
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    @torch.inference_mode()
+    def _generate_response(self, question: str, image_path: str) -> str:
         try:
             pixel_values = self.load_image(image_path, max_num=6).to(torch.bfloat16)
             if not self.device_map:
                 pixel_values = pixel_values.to(self.device)
 
-            generation_config = {
-                "num_beams": 1,
-                "max_new_tokens": self.config.get('max_length', 512),
-                "do_sample": self.config.get('do_sample', True),
-                "temperature": self.config.get('temperature', 0.7),
-                "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
-            }
-
-            response = self.model.chat(self.tokenizer, pixel_values, question, generation_config)
+            with self.feature_scope([image_path], [pixel_values.size(0)]):
+                response = self.model.chat(self.tokenizer, pixel_values, question, self._generation_config())
             return response
 
         except Exception as e:
@@ -156,6 +164,56 @@ class InternVLChatAdapter(BaseAdapter):
             if not self.device_map:
                 torch.cuda.empty_cache()
 
+    @torch.inference_mode()
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        try:
+            # batch_chat takes all tiles concatenated and splits them back per question with num_patches_list
+            tiles = [self.load_image(image_path, max_num=6) for image_path in image_paths]
+            num_patches_list = [t.size(0) for t in tiles]
+            pixel_values = torch.cat(tiles, dim=0).to(torch.bfloat16)
+            if not self.device_map:
+                pixel_values = pixel_values.to(self.device)
+
+            with self.feature_scope(image_paths, num_patches_list):
+                return self.model.batch_chat(
+                    self.tokenizer,
+                    pixel_values,
+                    num_patches_list=num_patches_list,
+                    questions=questions,
+                    generation_config=self._generation_config(),
+                )
+
+        except Exception as e:
+            logging.error(f"Error during batched model generation: {e}")
+            raise e
+        finally:
+            if not self.device_map:
+                torch.cuda.empty_cache()
+
+    def _generation_config(self) -> Dict[str, Any]:
+        return {
+            "num_beams": 1,
+            "max_new_tokens": self.config.get('max_length', 512),
+            "do_sample": self.config.get('do_sample', True),
+            "temperature": self.config.get('temperature', 0.7),
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            "streamer": metrics.timing_streamer(self.tokenizer),
+        }
+
+    def prefetch_image(self, image_path: str) -> None:
+        # Tiling is only worth doing ahead of time when the tiles are kept in the feature cache
+        if self.feature_cache is not None:
+            self.load_image(image_path, max_num=6)
+        else:
+            super().prefetch_image(image_path)
+
+    def enable_feature_cache(self, cache) -> bool:
+        # Caches both the dynamic_preprocess tiles and the ViT embeddings of each image
+        if not cache.wrap(self.model, "extract_feature"):
+            return False
+        self.feature_cache = cache
+        return True
+
     async def verify(self) -> bool:
         try:
             test_question = "What can you see in this image?"
@@ -1,7 +1,9 @@
 import torch
-from PIL import Image
-from typing import Dict, Any
+from typing import Dict, Any, List
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
+from plugins.collation import collate_encodings
 from transformers import AutoModelForVision2Seq, AutoImageProcessor, AutoTokenizer
 
 class JapaneseStableVLMAdapter(BaseAdapter):
@@ -33,26 +35,22 @@ class JapaneseStableVLMAdapter(BaseAdapter):
         return model_name.startswith('stabilityai/japanese-stable-vlm')
 
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    def _generate_response(self, question: str, image_path: str) -> str:
         prompt = self.build_prompt(task="vqa", input=question)
         
-        inputs = self.processor(images=[image], return_tensors="pt")
+        inputs = self.prepared_image(image_path).copy()
         text_encoding = self.tokenizer(prompt, add_special_tokens=False, return_tensors="pt")
         inputs.update(text_encoding)
         
-        generation_kwargs = {
-            "do_sample": False,
-            "max_new_tokens": self.config.get('max_length', 256),
-            "temperature": self.config.get('temperature', 0.7),
-            "min_length": 1,
-            "top_p": 0,
-            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
-        }
-        
         try:
             outputs = self.model.generate(
                 **inputs.to(self.device, dtype=self.model.dtype), 
-                **generation_kwargs
+                **self._generation_kwargs()
             )
             generated = [
                 txt.strip() for txt in self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
@@ -66,6 +64,46 @@ class JapaneseStableVLMAdapter(BaseAdapter):
             del outputs
             torch.cuda.empty_cache()
 
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        inputs = None
+        outputs = None
+        try:
+            encodings = []
+            for question, image_path in zip(questions, image_paths):
+                encoding = self.prepared_image(image_path).copy()
+                encoding.update(self.tokenizer(self.build_prompt(task="vqa", input=question), add_special_tokens=False, return_tensors="pt"))
+                encodings.append(encoding)
+            inputs = collate_encodings(encodings, self.tokenizer.pad_token_id)
+            inputs = {
+                k: v.to(self.device, dtype=self.model.dtype) if v.is_floating_point() else v.to(self.device)
+                for k, v in inputs.items()
+            }
+
+            outputs = self.model.generate(**inputs, **self._generation_kwargs())
+            return [txt.strip() for txt in self.tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+        except Exception as e:
+            print(f"Error during batched model generation: {e}")
+            raise e
+        finally:
+            del inputs
+            del outputs
+            torch.cuda.empty_cache()
+
+    def preprocess_image(self, image_path: str) -> Dict[str, Any]:
+        # Independent of the question, so prefetching does it ahead of generate
+        return self.processor(images=[load_image(image_path)], return_tensors="pt")
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        return {
+            "do_sample": False,
+            "max_new_tokens": self.config.get('max_length', 256),
+            "temperature": self.config.get('temperature', 0.7),
+            "min_length": 1,
+            "top_p": 0,
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            "streamer": metrics.timing_streamer(self.tokenizer),
+        }
+
     def build_prompt(self, task="vqa", input=None, sep="\n\n### "):
         TASK2INSTRUCTION = {
             "caption": "画像を詳細に述べてください。",
@@ -1,8 +1,11 @@
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
+from src.feature_cache import vision_owner
+from plugins.collation import collate_encodings
 import torch
-from PIL import Image
 from transformers import AutoProcessor, LlavaForConditionalGeneration
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 class LLaVAAdapter(BaseAdapter):
     dependencies = [
@@ -22,19 +25,53 @@ class LLaVAAdapter(BaseAdapter):
         return model_name.startswith("liuhaotian/llava-")
 
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    def _generate_response(self, question: str, image_path: str) -> str:
+        image = load_image(image_path)
         inputs = self.processor(text=question, images=image, return_tensors="pt").to(self.device)
         
-        with torch.no_grad():
+        with torch.no_grad(), self.feature_scope([image_path]):
             outputs = self.model.generate(
                 **inputs,
                 max_new_tokens=self.config['max_length'],
                 do_sample=True,
-                temperature=self.config['temperature']
+                temperature=self.config['temperature'],
+                streamer=metrics.timing_streamer(self.processor.tokenizer),
             )
         
         return self.processor.decode(outputs[0], skip_special_tokens=True)
 
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        encodings = [
+            self.processor(text=question, images=load_image(image_path), return_tensors="pt")
+            for question, image_path in zip(questions, image_paths)
+        ]
+        inputs = collate_encodings(encodings, self.processor.tokenizer.pad_token_id)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+        with torch.no_grad(), self.feature_scope(image_paths):
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=self.config['max_length'],
+                do_sample=True,
+                temperature=self.config['temperature'],
+                streamer=metrics.timing_streamer(self.processor.tokenizer),
+            )
+
+        return self.processor.batch_decode(outputs, skip_special_tokens=True)
+
+    def enable_feature_cache(self, cache) -> bool:
+        # The projected image features depend only on the image, so they are reused across questions
+        owner = vision_owner(self.model, "get_image_features")
+        if owner is None or not cache.wrap(owner, "get_image_features"):
+            return False
+        self.feature_cache = cache
+        return True
+
     async def verify(self) -> bool:
         try:
             test_question = "What is in this image?"
@@ -1,16 +1,18 @@
-import base64
+import asyncio
 import os
-import requests
 from typing import Dict, Any
-from PIL import Image
 from plugins.base_adapter import BaseAdapter
-from tenacity import retry, stop_after_attempt, wait_fixed
+from src.http_client import get_http_client, openai_base_url
+from src.image_cache import get_image_cache
+from src import metrics
+from src.resilience import call_with_retries
 
 class OpenAIAdapter(BaseAdapter):
     dependencies = [
-        'requests>=2.25.0',
+        'httpx',
         'pillow>=8.0.0',
     ]
+    supports_concurrency = True
 
     def __init__(self, model_name: str, device: str, config: Dict[str, Any]):
         super().__init__(model_name, device)
@@ -30,12 +32,11 @@ class OpenAIAdapter(BaseAdapter):
         ]
 
     def encode_image(self, image_path: str) -> str:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return get_image_cache().base64(image_path)
 
-    @retry(stop=stop_after_attempt(5), wait=wait_fixed(30))
     async def generate_response(self, question: str, image_path: str) -> str:
-        base64_image = self.encode_image(image_path)
+        # Decoding and encoding a cache miss would otherwise hold every in-flight request
+        base64_image = await asyncio.to_thread(self.encode_image, image_path)
 
         headers = {
             "Content-Type": "application/json",
@@ -65,9 +66,20 @@ class OpenAIAdapter(BaseAdapter):
             "temperature": self.temperature
         }
 
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        async def post() -> Dict[str, Any]:
+            response = await get_http_client().post(
+                f"{openai_base_url()}/chat/completions", headers=headers, json=payload
+            )
+            response.raise_for_status()
+            return response.json()
+
+        result = await call_with_retries(post, openai_base_url(), description=f"{self.model_name} request")
+        usage = result.get("usage") or {}
+        metrics.record(input_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+        return result["choices"][0]["message"]["content"]
+
+    def prefetch_image(self, image_path: str) -> None:
+        self.encode_image(image_path)
 
     async def verify(self) -> bool:
         try:
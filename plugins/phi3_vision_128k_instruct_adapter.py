@@ -1,7 +1,9 @@
 import torch
-from PIL import Image
-from typing import Dict, Any
+from typing import Dict, Any, List
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
+from plugins.collation import collate_encodings
 from transformers import AutoModelForCausalLM, AutoProcessor
 import logging
 
@@ -28,30 +30,21 @@ class Phi3Vision128KInstructAdapter(BaseAdapter):
     def supports_model(cls, model_name: str) -> bool:
         return model_name == 'microsoft/Phi-3-vision-128k-instruct'
 
-    @torch.inference_mode()
     async def generate_response(self, question: str, image_path: str) -> str:
-        image = Image.open(image_path)
-        
-        messages = [
-            {"role": "user", "content": f"<|image_1|>\n{question}"},
-        ]
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self.run_blocking(self._generate_batch, questions, image_paths)
+
+    @torch.inference_mode()
+    def _generate_response(self, question: str, image_path: str) -> str:
+        image = load_image(image_path)
         
         try:
-            prompt = self.processor.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            prompt = self._build_prompt(question)
             inputs = self.processor(prompt, [image], return_tensors="pt").to(self.device)
             
-            generation_args = {
-                "max_new_tokens": self.config.get('max_length', 256),
-                "temperature": self.config.get('temperature', 0.7),
-                "do_sample": self.config.get('do_sample', True),
-            }
-            
-            generate_ids = self.model.generate(
-                **inputs,
-                eos_token_id=self.processor.tokenizer.eos_token_id, 
-                no_repeat_ngram_size=self.config.get('no_repeat_ngram_size', 3),
-                **generation_args
-            )
+            generate_ids = self.model.generate(**inputs, **self._generation_kwargs())
             
             generate_ids = generate_ids[:, inputs['input_ids'].shape[1]:]
             response = self.processor.batch_decode(generate_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)[0] 
@@ -65,6 +58,47 @@ class Phi3Vision128KInstructAdapter(BaseAdapter):
             del inputs
             torch.cuda.empty_cache()
 
+    @torch.inference_mode()
+    def _generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        inputs = None
+        try:
+            # The processor handles one prompt at a time; pixel_values are padded to a fixed
+            # number of crops, so per-sample encodings can be stacked after left-padding the prompts.
+            encodings = [
+                self.processor(self._build_prompt(question), [load_image(image_path)], return_tensors="pt")
+                for question, image_path in zip(questions, image_paths)
+            ]
+            inputs = collate_encodings(encodings, self.processor.tokenizer.pad_token_id)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+            generate_ids = self.model.generate(**inputs, **self._generation_kwargs())
+
+            generate_ids = generate_ids[:, inputs['input_ids'].shape[1]:]
+            return self.processor.batch_decode(generate_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+
+        except Exception as e:
+            logging.error(f"Error during batched model generation: {e}")
+            raise e
+        finally:
+            del inputs
+            torch.cuda.empty_cache()
+
+    def _build_prompt(self, question: str) -> str:
+        messages = [
+            {"role": "user", "content": f"<|image_1|>\n{question}"},
+        ]
+        return self.processor.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        return {
+            "max_new_tokens": self.config.get('max_length', 256),
+            "temperature": self.config.get('temperature', 0.7),
+            "do_sample": self.config.get('do_sample', True),
+            "eos_token_id": self.processor.tokenizer.eos_token_id,
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            "streamer": metrics.timing_streamer(self.processor.tokenizer),
+        }
+
     async def verify(self) -> bool:
         try:
             test_question = "What is in this image?"
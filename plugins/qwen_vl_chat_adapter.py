@@ -26,8 +26,11 @@ class QwenVLChatAdapter(BaseAdapter):
     def supports_model(cls, model_name: str) -> bool:
         return model_name.startswith('Qwen/Qwen-VL-Chat')
 
-    @torch.inference_mode()
     async def generate_response(self, question: str, image_path: str) -> str:
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    @torch.inference_mode()
+    def _generate_response(self, question: str, image_path: str) -> str:
         query = self.tokenizer.from_list_format([
             {'image': image_path},
             {'text': question},
@@ -1,7 +1,8 @@
 import torch
-from PIL import Image
 from typing import Dict, Any
 from plugins.base_adapter import BaseAdapter
+from src import metrics
+from src.image_cache import load_image
 from transformers import AutoProcessor, LlamaTokenizer
 from heron.models.git_llm.git_japanese_stablelm_alpha import GitJapaneseStableLMAlphaForCausalLM
 import logging
@@ -46,8 +47,11 @@ class HeronChatGitJaStablelmBase7BV1Adapter(BaseAdapter):
         return model_name.startswith("turing-motors/heron-chat-git-ja-stablelm-base-7b-v1")
 
     async def generate_response(self, question: str, image_path: str) -> str:
+        return await self.run_blocking(self._generate_response, question, image_path)
+
+    def _generate_response(self, question: str, image_path: str) -> str:
         try:
-            image = Image.open(image_path).convert("RGB")
+            image = load_image(image_path).convert("RGB")
             text = f"##human: {question}\n##gpt: "
 
             inputs = self.processor(
@@ -60,7 +64,10 @@ class HeronChatGitJaStablelmBase7BV1Adapter(BaseAdapter):
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
 
             with torch.no_grad():
-                out = self.model.generate(**inputs, max_length=256, do_sample=False, temperature=0., no_repeat_ngram_size=2)
+                out = self.model.generate(
+                    **inputs, max_length=256, do_sample=False, temperature=0., no_repeat_ngram_size=2,
+                    streamer=metrics.timing_streamer(self.tokenizer),
+                )
 
             response = self.processor.tokenizer.batch_decode(out, skip_special_tokens=True)[0]
             return response.split("##gpt: ")[-1].strip()
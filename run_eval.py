@@ -1,12 +1,20 @@
 import asyncio
 import os
+from typing import Any, Dict
 import hydra
 from omegaconf import DictConfig, OmegaConf
 import wandb
-import pandas as pd
 from src.plugin_manager import PluginManager
-from src.common_evaluation import evaluate_benchmark
+from src.common_evaluation import evaluate_benchmark, log_leaderboard
 from src.caching import disk_cache
+from src.http_client import close_http_client, configure_endpoints
+from src.image_cache import configure_image_cache
+from src.model_worker import RemoteAdapter
+from src.feature_cache import configure_feature_cache
+from src.data_parallel import DataParallelAdapter
+from src.rate_limit import RateLimiter
+from src.resilience import configure_resilience
+from src import profiling
 
 @hydra.main(config_path="configs", config_name="config", version_base="1.3")
 def main(cfg: DictConfig) -> None:
@@ -29,40 +37,85 @@ async def async_main(cfg: DictConfig) -> None:
     # Convert Python dictionary to DictConfig
     cfg = OmegaConf.create(config_dict)
 
-    plugin_manager = PluginManager("plugins")
-    adapter = plugin_manager.get_adapter(
-        cfg.model.pretrained_model_name_or_path,
-        f"cuda:{cfg.device_id}",
-        cfg.generation.args,
+    profiling.configure_profiling(cfg.get('profiling'))
+    configure_endpoints(cfg.get('endpoints'))
+    configure_resilience(cfg.get('resilience'))
+    image_cache = configure_image_cache(int(cfg.get('image_cache', {}).get('max_size_mb', 512) * 1024 * 1024))
+
+    worker_config = cfg.get('worker', {})
+    devices = list(cfg.get('data_parallel', {}).get('devices') or [])
+    if worker_config.get('attach', False):
+        # Reuse the weights held by a running `python -m src.model_worker`
+        adapter = RemoteAdapter(
+            cfg.model.pretrained_model_name_or_path,
+            f"{worker_config.get('host', '127.0.0.1')}:{worker_config.get('port', 8765)}",
+            OmegaConf.to_container(cfg.generation.args, resolve=True),
+        )
+        info = await adapter.connect()
+        # Vision features are cached inside the worker, next to the model
+        feature_cache = None
+        print(f"Debug: attached to model worker {adapter.device} serving {info['adapter']}")
+    elif devices:
+        # One adapter per device in its own process; questions are shared out as workers free up
+        adapter = DataParallelAdapter(
+            cfg.model.pretrained_model_name_or_path,
+            devices,
+            OmegaConf.to_container(cfg.generation.args, resolve=True),
+            vision_cache=OmegaConf.to_container(cfg.vision_cache, resolve=True) if 'vision_cache' in cfg else None,
+        )
+        print(f"Debug: starting data-parallel workers on {devices}: {await adapter.start()}")
+        if cfg.generation.get('concurrency', 1) < len(devices):
+            print(f"Warning: generation.concurrency is below the number of devices; some will sit idle")
+        # Each worker process keeps its own vision cache
+        feature_cache = None
+    else:
+        plugin_manager = PluginManager("plugins")
+        for adapter_name, status in plugin_manager.availability().items():
+            print(f"Debug: adapter {adapter_name}: {status}")
+        with profiling.span("load_adapter", model=cfg.model.pretrained_model_name_or_path):
+            adapter = plugin_manager.get_adapter(
+                cfg.model.pretrained_model_name_or_path,
+                f"cuda:{cfg.device_id}",
+                cfg.generation.args,
+            )
+        feature_cache = configure_feature_cache(adapter, cfg.get('vision_cache'))
+
+    # One generation budget and one judge rate limit cover all benchmarks, whether they run
+    # one after another or at the same time
+    concurrency = cfg.generation.get('concurrency', 1) if adapter.supports_concurrency else 1
+    adapter_semaphore = asyncio.Semaphore(max(1, concurrency))
+    judge_config = cfg.get('judge', {})
+    limiter = RateLimiter(
+        requests_per_minute=judge_config.get('requests_per_minute'),
+        tokens_per_minute=judge_config.get('tokens_per_minute'),
+        max_in_flight=judge_config.get('max_in_flight', 8),
     )
 
-    # Iterate through each benchmark defined in the configuration
-    for benchmark_name, benchmark_config in cfg.benchmarks.items():
+    async def run_benchmark(benchmark_name: str) -> Dict[str, Any]:
         print(f"Debug: Processing benchmark: {benchmark_name}")
-        print(f"Debug: Benchmark config: {OmegaConf.to_yaml(benchmark_config)}")
-        results = await evaluate_benchmark(adapter, benchmark_name)
-        wandb.log({f"{benchmark_name}_results": results})
+        print(f"Debug: Benchmark config: {OmegaConf.to_yaml(cfg.benchmarks[benchmark_name])}")
+        with profiling.span("benchmark", name=benchmark_name):
+            return await evaluate_benchmark(adapter, benchmark_name, adapter_semaphore=adapter_semaphore, limiter=limiter)
 
-    # Log final results
-    lb_dict = wandb.run.summary.get('lb_dict', {})
-    lb_df = pd.DataFrame(columns=lb_dict.keys(), data=[lb_dict.values()])
-    if not lb_df.empty:
-        # Create a list of benchmark names
-        benchmark_names = cfg.benchmarks.keys()
-        
-        # Create a dataframe for radar chart
-        radar_df = lb_df.drop(['model_name'] + [f"ave_{name}" for name in benchmark_names], axis=1)
-        radar_df = radar_df.T.reset_index()
-        radar_df.columns = ['category', 'score']
-        
-        # Log to wandb
-        wandb.log({
-            "lb_table": wandb.Table(dataframe=lb_df),
-            "radar_table": wandb.Table(dataframe=radar_df)
-        })
+    benchmark_names = list(cfg.benchmarks.keys())
+    if cfg.get('concurrent_benchmarks', False):
+        benchmark_columns = await asyncio.gather(*(run_benchmark(name) for name in benchmark_names))
     else:
-        print("Warning: lb_df is empty. Cannot log results.")
+        benchmark_columns = [await run_benchmark(name) for name in benchmark_names]
+
+    log_leaderboard(wandb.run, cfg, benchmark_columns)
 
+    print(f"Image cache: {image_cache.stats()}")
+    if feature_cache is not None:
+        print(f"Vision feature cache: {feature_cache.stats()}")
+    if isinstance(adapter, DataParallelAdapter):
+        print(f"Data-parallel items per worker: {adapter.stats()}")
+        adapter.close()
+    trace_path = profiling.write_trace(wandb.run.id)
+    if trace_path is not None:
+        print(f"Profiling trace written to {trace_path}")
+        wandb.save(trace_path, base_path=os.path.dirname(trace_path), policy="now")
+    await close_http_client()
     wandb.finish()
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import asyncio
+import gc
+import sys
+from typing import Any, Dict
+import hydra
+from omegaconf import DictConfig, OmegaConf
+import wandb
+from plugins.base_adapter import BaseAdapter
+from src.plugin_manager import PluginManager
+from src.common_evaluation import evaluate_benchmark, load_benchmark_data, log_leaderboard
+from src.http_client import close_http_client, configure_endpoints
+from src.image_cache import configure_image_cache
+from src.feature_cache import configure_feature_cache
+from src.rate_limit import RateLimiter
+from src.resilience import configure_resilience
+from src.dataset_store import dataset_store_from_config
+from src import profiling
+
+@hydra.main(config_path="configs", config_name="config", version_base="1.3")
+def main(cfg: DictConfig) -> None:
+    asyncio.run(async_main(cfg))
+
+def release_memory() -> None:
+    gc.collect()
+    if "torch" in sys.modules:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+async def evaluate_model(
+    run: Any,
+    adapter: BaseAdapter,
+    cfg: DictConfig,
+    data: Dict[str, Dict[str, Any]],
+    limiter: RateLimiter,
+    generated: asyncio.Event
+) -> Dict[str, Any]:
+    # Same as one run_eval.py run, except that `generated` is set as soon as every benchmark has
+    # its answers, so the sweep can unload the model while the judge is still working
+    concurrency = cfg.generation.get('concurrency', 1) if adapter.supports_concurrency else 1
+    adapter_semaphore = asyncio.Semaphore(max(1, concurrency))
+    benchmark_names = list(cfg.benchmarks.keys())
+    remaining = len(benchmark_names)
+
+    def on_generated() -> None:
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            generated.set()
+
+    async def run_benchmark(benchmark_name: str) -> Dict[str, Any]:
+        print(f"Debug: Processing benchmark {benchmark_name} for {adapter.model_name}")
+        with profiling.span("benchmark", name=benchmark_name, model=adapter.model_name):
+            return await evaluate_benchmark(
+                adapter, benchmark_name,
+                adapter_semaphore=adapter_semaphore,
+                limiter=limiter,
+                run=run,
+                data=data[benchmark_name],
+                on_generated=on_generated,
+            )
+
+    if cfg.get('concurrent_benchmarks', False):
+        benchmark_columns = await asyncio.gather(*(run_benchmark(name) for name in benchmark_names))
+    else:
+        benchmark_columns = [await run_benchmark(name) for name in benchmark_names]
+
+    lb_dict = log_leaderboard(run, cfg, benchmark_columns)
+    run.finish()
+    return lb_dict
+
+async def async_main(cfg: DictConfig) -> None:
+    models = list(cfg.get('sweep', {}).get('models') or [])
+    if not models:
+        raise ValueError("sweep.models must list at least one model")
+    base_config = OmegaConf.to_container(cfg, resolve=True, throw_on_missing=True)
+
+    profiling.configure_profiling(cfg.get('profiling'))
+    configure_endpoints(cfg.get('endpoints'))
+    configure_resilience(cfg.get('resilience'))
+    configure_image_cache(int(cfg.get('image_cache', {}).get('max_size_mb', 512) * 1024 * 1024))
+    # One judge budget for the whole sweep; answer and judge caches are shared through the cache
+    # directory's store, and the benchmark data is downloaded and joined once
+    judge_config = cfg.get('judge', {})
+    limiter = RateLimiter(
+        requests_per_minute=judge_config.get('requests_per_minute'),
+        tokens_per_minute=judge_config.get('tokens_per_minute'),
+        max_in_flight=judge_config.get('max_in_flight', 8),
+    )
+    plugin_manager = PluginManager("plugins")
+    store = dataset_store_from_config(cfg.get('dataset_store'))
+    data = None
+    evaluations = []
+
+    try:
+        for model_name in models:
+            model_config = {**base_config, "model": {**base_config["model"], "pretrained_model_name_or_path": model_name}}
+            # Each model gets its own run, which stays open while its judging finishes in the background
+            run = wandb.init(
+                project=cfg.wandb.project,
+                entity=cfg.wandb.entity,
+                config=model_config,
+                name=model_name,
+                reinit="create_new",
+            )
+            model_cfg = OmegaConf.create(dict(run.config))
+
+            if data is None:
+                benchmark_names = list(model_cfg.benchmarks.keys())
+                loaded = await asyncio.gather(*(
+                    load_benchmark_data(run, model_cfg.benchmarks[name], store) for name in benchmark_names
+                ))
+                data = dict(zip(benchmark_names, loaded))
+            elif store is None or not store.offline:
+                # Record the datasets on this run as well; their files are already loaded
+                await asyncio.gather(*(
+                    asyncio.to_thread(run.use_artifact, benchmark_config[key], type='dataset')
+                    for benchmark_config in model_cfg.benchmarks.values()
+                    for key in ('artifact_path', 'reference_path')
+                ))
+
+            print(f"Debug: Loading {model_name}")
+            with profiling.span("load_adapter", model=model_name):
+                adapter = await asyncio.to_thread(
+                    plugin_manager.get_adapter, model_name, f"cuda:{cfg.device_id}", model_cfg.generation.args
+                )
+            configure_feature_cache(adapter, model_cfg.get('vision_cache'))
+
+            generated = asyncio.Event()
+            evaluation = asyncio.create_task(evaluate_model(run, adapter, model_cfg, data, limiter, generated))
+            evaluations.append(evaluation)
+            waiter = asyncio.create_task(generated.wait())
+            await asyncio.wait([evaluation, waiter], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if evaluation.done() and evaluation.exception() is not None:
+                raise evaluation.exception()
+
+            # Only one local model is resident at a time; judging of this one continues meanwhile
+            print(f"Debug: Generation finished for {model_name}; unloading")
+            adapter.unload()
+            del adapter
+            release_memory()
+
+        for model_name, lb_dict in zip(models, await asyncio.gather(*evaluations)):
+            print(f"Debug: {model_name}: {lb_dict}")
+    finally:
+        for evaluation in evaluations:
+            evaluation.cancel()
+        # One trace covers the whole sweep, so overlapping models show up side by side
+        trace_path = profiling.write_trace("sweep")
+        if trace_path is not None:
+            print(f"Profiling trace written to {trace_path}")
+        await close_http_client()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+import pandas as pd
+from omegaconf import OmegaConf
+from PIL import Image
+from plugins.base_adapter import BaseAdapter
+from src import metrics, profiling
+from src.common_evaluation import evaluate_benchmark
+from src.http_client import close_http_client
+from src.image_cache import configure_image_cache, load_image
+from src.llm_judge import LLMJudge
+
+# Drives evaluate_benchmark end to end on a synthetic dataset with a mock adapter and a mock judge:
+# no network, wandb backend or GPU. Run from the repository root:
+#
+#   python -m scripts.bench_pipeline --concurrency 1 4 16 --output bench.json
+#
+# and compare the JSON of two commits to catch regressions in the orchestration layer.
+
+BENCHMARK_NAME = "synthetic"
+
+class MockAdapter(BaseAdapter):
+    def __init__(self, latency: float, blocking: bool, batch_item_cost: float):
+        # blocking=True sleeps in the adapter's worker thread like a local model's generate does;
+        # otherwise it awaits like an API client and accepts concurrent calls
+        super().__init__("mock-model", "cpu")
+        self.latency = latency
+        self.blocking = blocking
+        self.batch_item_cost = batch_item_cost
+        self.supports_concurrency = not blocking
+
+    @classmethod
+    def supports_model(cls, model_name: str) -> bool:
+        return model_name == "mock-model"
+
+    async def _wait(self, seconds: float) -> None:
+        if self.blocking:
+            await self.run_blocking(time.sleep, seconds)
+        else:
+            await asyncio.sleep(seconds)
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        load_image(image_path)
+        await self._wait(self.latency * random.uniform(0.5, 1.5))
+        metrics.record(input_tokens=len(question), output_tokens=64)
+        return f"Mock answer to: {question}"
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        for image_path in image_paths:
+            load_image(image_path)
+        await self._wait(self.latency * (1 + self.batch_item_cost * (len(questions) - 1)))
+        metrics.record(
+            batch_output_tokens=64 * len(questions),
+            rows=[{"input_tokens": len(q), "output_tokens": 64} for q in questions],
+        )
+        return [f"Mock answer to: {question}" for question in questions]
+
+    async def verify(self) -> bool:
+        return True
+
+class MockJudge(LLMJudge):
+    latency = 0.05
+
+    async def _complete(self, messages: List[Dict[str, Any]], estimated_tokens: int):
+        # Goes through the real limiter, so rate limiting and queueing are part of the measurement
+        queued = time.monotonic()
+        async with self.limiter.slot(estimated_tokens):
+            started = time.monotonic()
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+            self.limiter.settle(estimated_tokens, estimated_tokens)
+        return "Mock judgement. Rating: [[7]]", {
+            "latency": time.monotonic() - started,
+            "queue_wait": started - queued,
+            "retries": 0,
+            "input_tokens": estimated_tokens - self.max_tokens,
+            "output_tokens": 16,
+            "total_tokens": estimated_tokens - self.max_tokens + 16,
+        }
+
+class LocalArtifact:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def download(self) -> str:
+        return self.directory
+
+class LocalRun:
+    # The parts of a wandb run that evaluate_benchmark uses, kept in memory
+    def __init__(self, config: Dict[str, Any], artifacts: Dict[str, str]):
+        self.config = config
+        self.artifacts = artifacts
+        self.summary: Dict[str, Any] = {}
+        self.logged: List[str] = []
+
+    def use_artifact(self, artifact_path: str, type: str) -> LocalArtifact:
+        return LocalArtifact(self.artifacts[artifact_path])
+
+    def log(self, data: Dict[str, Any]) -> None:
+        self.logged.extend(data.keys())
+
+def make_dataset(root: str, items: int, images: int, seed: int) -> None:
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "data", "images"), exist_ok=True)
+    os.makedirs(os.path.join(root, "reference"), exist_ok=True)
+    image_names = []
+    for i in range(images):
+        name = f"image_{i:04d}.png"
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new("RGB", (512, 384), color).save(os.path.join(root, "data", "images", name))
+        image_names.append(name)
+    categories = ["conv", "detail", "complex"]
+    with open(os.path.join(root, "data", "questions.jsonl"), "w") as q, \
+            open(os.path.join(root, "reference", "answers.jsonl"), "w") as r:
+        for i in range(items):
+            question = "この画像について説明してください。" * rng.randint(1, 8)
+            q.write(json.dumps({
+                "question_id": i, "image": image_names[i % images], "category": categories[i % 3], "question": question,
+            }, ensure_ascii=False) + "\n")
+            r.write(json.dumps({"question_id": i, "answer": f"Reference answer {i}"}) + "\n")
+    with open(os.path.join(root, "data", "contexts.jsonl"), "w") as c:
+        for name in image_names:
+            c.write(json.dumps({"image": name, "caption": f"A plain image named {name}"}) + "\n")
+
+def make_config(args: argparse.Namespace, concurrency: int) -> Dict[str, Any]:
+    cfg = OmegaConf.load(os.path.join(os.path.dirname(__file__), "..", "configs", "base_config.yaml"))
+    cfg.pop("defaults", None)
+    cfg.model = {"pretrained_model_name_or_path": "mock-model"}
+    cfg.benchmarks = {BENCHMARK_NAME: {
+        "name": BENCHMARK_NAME,
+        "artifact_path": "local/data",
+        "questions_file": "questions.jsonl",
+        "context_file": "contexts.jsonl",
+        "reference_path": "local/reference",
+        "reference_file": "answers.jsonl",
+        "question_key": "question",
+        "context_key": "caption",
+        "image_key": "image",
+        "table_columns": ["benchmark", "question_id", "category", "image", "question", "answer"],
+    }}
+    cfg.generation.concurrency = concurrency
+    cfg.generation.batch_size = args.batch_size
+    cfg.judge.pipeline = args.pipeline
+    cfg.judge.max_in_flight = args.judge_concurrency
+    cfg.judge.requests_per_minute = None
+    cfg.judge.tokens_per_minute = None
+    # Every level has to do the full work, so nothing may be served from earlier levels
+    cfg.cache.generation = False
+    cfg.cache.judge = False
+    cfg.checkpoint.resume = False
+    cfg.dataset_store.enabled = False
+    return OmegaConf.to_container(cfg, resolve=True)
+
+def stage_timings(tracer: profiling.Tracer) -> Dict[str, Dict[str, float]]:
+    durations = defaultdict(list)
+    for event in tracer.events:
+        if event["ph"] == "X":
+            durations[event["name"]].append(event["dur"] / 1e6)
+    summary = {}
+    for name, values in sorted(durations.items()):
+        series = pd.Series(values)
+        summary[name] = {
+            "count": len(values),
+            "total_s": float(series.sum()),
+            "p50_ms": float(series.quantile(0.5) * 1000),
+            "p95_ms": float(series.quantile(0.95) * 1000),
+        }
+    return summary
+
+async def run_level(args: argparse.Namespace, root: str, concurrency: int) -> Dict[str, Any]:
+    run = LocalRun(
+        make_config(args, concurrency),
+        {"local/data": os.path.join(root, "data"), "local/reference": os.path.join(root, "reference")},
+    )
+    adapter = MockAdapter(args.gen_latency, args.blocking, args.batch_item_cost)
+    MockJudge.latency = args.judge_latency
+    # Fresh caches and tracer per level, so decode work and stage timings are not carried over
+    configure_image_cache(512 * 1024 * 1024)
+    tracer = profiling.configure_profiling({"enabled": True, "dir": os.path.join(root, "profiles")})
+
+    started = time.perf_counter()
+    await evaluate_benchmark(adapter, BENCHMARK_NAME, run=run, judge_factory=MockJudge)
+    seconds = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "items": args.items,
+        "seconds": seconds,
+        "items_per_sec": args.items / seconds,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; it only grows over the process lifetime
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if platform.system() == "Darwin" else 1024),
+        "stages": stage_timings(tracer),
+        "item_metrics": run.summary.get(f"{BENCHMARK_NAME}_item_metrics", {}),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation pipeline with a mock adapter and judge")
+    parser.add_argument("--items", type=int, default=200, help="Number of synthetic questions")
+    parser.add_argument("--images", type=int, default=40, help="Number of distinct synthetic images")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="generation.concurrency levels")
+    parser.add_argument("--batch-size", type=int, default=1, help="generation.batch_size")
+    parser.add_argument("--batch-item-cost", type=float, default=0.1, help="Extra latency per additional batch item, as a fraction of --gen-latency")
+    parser.add_argument("--gen-latency", type=float, default=0.02, help="Mean seconds per generate call")
+    parser.add_argument("--judge-latency", type=float, default=0.05, help="Mean seconds per judge request")
+    parser.add_argument("--judge-concurrency", type=int, default=8, help="judge.max_in_flight")
+    parser.add_argument("--blocking", action="store_true", help="Generate one call at a time in a worker thread, like a local model")
+    parser.add_argument("--no-pipeline", dest="pipeline", action="store_false", help="Judge after generation instead of alongside it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="bench_pipeline.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # LLMJudge builds an OpenAI client; the mock never sends a request with it
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    output = os.path.abspath(args.output)
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline-") as root:
+        make_dataset(root, args.items, args.images, args.seed)
+        # evaluate_benchmark writes <benchmark>_output/ relative to the working directory
+        os.chdir(root)
+        levels = []
+        try:
+            for concurrency in args.concurrency:
+                result = await run_level(args, root, concurrency)
+                levels.append(result)
+                print(f"concurrency={concurrency}: {result['items_per_sec']:.1f} items/s, "
+                      f"{result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB")
+        finally:
+            os.chdir(cwd)
+            await close_http_client()
+
+    report = {"args": vars(args), "results": levels}
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -158,7 +158,11 @@ class AdapterGenerator:
                 return model_name.startswith("{model_name}")
 
             async def generate_response(self, question: str, image_path: str) -> str:
-                # Implement the generate_response method
+                return await self.run_blocking(self._generate_response, question, image_path)
+
+            @torch.inference_mode()
+            def _generate_response(self, question: str, image_path: str) -> str:
+                # Implement preprocessing and model.generate here; it runs on a worker thread
 
             async def verify(self) -> bool:
                 # Implement the verify method
@@ -0,0 +1,320 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# A local stand-in for the OpenAI chat completions and Anthropic messages APIs, for load testing
+# OpenAIAdapter, ClaudeAdapter and LLMJudge without spending quota:
+#
+#   python scripts/mock_api_server.py --port 8000 --latency 1.5 --rate-429 0.05 --rate-5xx 0.02
+#   python3 run_eval.py endpoints.openai=http://127.0.0.1:8000/v1 endpoints.anthropic=http://127.0.0.1:8000
+#
+# Responses end with "Rating: [[N]]" so the judge can parse them. GET /stats returns request counts.
+
+# Same rough per-image cost the judge budgets with
+IMAGE_TOKENS = 765
+
+class LatencyModel:
+    def __init__(self, distribution: str, median: float, sigma: float, tail_rate: float, tail_latency: float):
+        self.distribution = distribution
+        self.median = median
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "fixed":
+            latency = self.median
+        elif self.distribution == "exponential":
+            latency = rng.expovariate(math.log(2) / self.median) if self.median > 0 else 0.0
+        else:
+            latency = self.median * math.exp(rng.gauss(0, self.sigma))
+        # Rare stragglers on top of the body of the distribution, like a stuck upstream connection
+        if rng.random() < self.tail_rate:
+            latency += self.tail_latency
+        return latency
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connection bursts, which would look like network stalls
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], args: argparse.Namespace):
+        super().__init__(address, MockHandler)
+        self.args = args
+        self.latency = LatencyModel(args.latency_dist, args.latency, args.latency_sigma, args.tail_rate, args.tail_latency)
+        # Each request draws from its own generator, seeded with the seed and its arrival number,
+        # so seeded runs repeat whatever order the handler threads happen to run in
+        self.seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def admit(self) -> bool:
+        with self.lock:
+            if self.args.max_concurrency and self.in_flight >= self.args.max_concurrency:
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def draw(self, api: str) -> Tuple[Optional[int], float, float]:
+        # Decides a request's fate up front: (error status or None, latency, random value for the response)
+        with self.lock:
+            self.requests += 1
+            rng = random.Random(f"{self.seed}:{self.requests}")
+        roll = rng.random()
+        status = None
+        if roll < self.args.rate_429:
+            status = 429
+        elif roll < self.args.rate_429 + self.args.rate_5xx:
+            status = rng.choice([500, 502, 503] if api == "openai" else [500, 529])
+        return status, self.latency.sample(rng), rng.random()
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"counts": dict(self.counts), "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight}
+
+def count_input_tokens(messages: List[Dict[str, Any]], system: Any = None) -> int:
+    # Japanese text is close to one token per character, which is all the precision a mock needs
+    tokens = len(system) if isinstance(system, str) else 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "text":
+                tokens += len(part.get("text") or "")
+            elif part.get("type") in ("image_url", "image"):
+                tokens += IMAGE_TOKENS
+    return max(1, tokens)
+
+def make_reply(max_tokens: int, output_tokens: int, value: float) -> List[str]:
+    # One list entry per output token
+    count = max(1, min(max_tokens, output_tokens))
+    rating = 1 + int(value * 10)
+    return ["モック"] * (count - 1) + [f" Rating: [[{rating}]]"]
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    routes = {
+        "/v1/chat/completions": "openai",
+        "/chat/completions": "openai",
+        "/v1/messages": "anthropic",
+    }
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        api = self.routes.get(self.path.split("?")[0])
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if api is None:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        if not self.server.admit():
+            self.server.count(f"{api}:429")
+            self._send_error(api, 429, "Too many concurrent requests (mock)")
+            return
+        try:
+            status, latency, value = self.server.draw(api)
+            if status is not None:
+                # Errors come back quickly, as they do from a real gateway
+                time.sleep(min(latency, self.server.args.error_latency))
+                self.server.count(f"{api}:{'429' if status == 429 else '5xx'}")
+                self._send_error(api, status, "Simulated failure (mock)")
+                return
+            self.server.count(f"{api}:200")
+            if api == "openai":
+                self._openai(body, latency, value)
+            else:
+                self._anthropic(body, latency, value)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a deadline or a hedged request that lost the race
+            self.server.count(f"{api}:disconnected")
+        finally:
+            self.server.release()
+
+    def _send_error(self, api: str, status: int, message: str) -> None:
+        args = self.server.args
+        headers = {}
+        if args.retry_after > 0 and status in (429, 503, 529):
+            headers["retry-after"] = str(math.ceil(args.retry_after))
+            if api == "openai":
+                headers["retry-after-ms"] = str(int(args.retry_after * 1000))
+        if api == "openai":
+            error_type = "requests" if status == 429 else "server_error"
+            body = {"error": {"message": message, "type": error_type, "param": None, "code": None}}
+        else:
+            error_type = {429: "rate_limit_error", 529: "overloaded_error"}.get(status, "api_error")
+            body = {"type": "error", "error": {"type": error_type, "message": message}}
+        self._send_json(status, body, headers)
+
+    def _output_tokens(self, value: float) -> int:
+        low, high = self.server.args.output_tokens
+        return low + int(value * (high - low + 1))
+
+    def _start_stream(self) -> None:
+        # Event streams end by closing the connection, so no length or chunking is needed
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+    def _stream_pieces(self, pieces: List[str], latency: float):
+        # Time to first token takes a fixed share of the latency; the rest is spread over the tokens
+        ttft = latency * self.server.args.ttft_fraction
+        time.sleep(ttft)
+        interval = (latency - ttft) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(interval)
+            yield piece
+
+    def _event(self, data: Dict[str, Any], event: Optional[str] = None) -> None:
+        prefix = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode())
+        self.wfile.flush()
+
+    def _openai(self, body: Dict[str, Any], latency: float, value: float) -> None:
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or 4096
+        pieces = make_reply(max_tokens, self._output_tokens(value), value)
+        usage = {
+            "prompt_tokens": count_input_tokens(body.get("messages", [])),
+            "completion_tokens": len(pieces),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        common = {"id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "mock")}
+
+        if not body.get("stream"):
+            time.sleep(latency)
+            self._send_json(200, {
+                **common,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self._start_stream()
+        chunk = {**common, "object": "chat.completion.chunk"}
+        self._event({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for piece in self._stream_pieces(pieces, latency):
+            self._event({**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({**chunk, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _anthropic(self, body: Dict[str, Any], latency: float, value: float) -> None:
+        pieces = make_reply(body.get("max_tokens", 4096), self._output_tokens(value), value)
+        input_tokens = count_input_tokens(body.get("messages", []), body.get("system"))
+        message = {
+            "id": f"msg_mock_{uuid.uuid4().hex[:12]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock"),
+            "stop_sequence": None,
+        }
+
+        if not body.get("stream"):
+            time.sleep(latency)
+            self._send_json(200, {
+                **message,
+                "content": [{"type": "text", "text": "".join(pieces)}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": input_tokens, "output_tokens": len(pieces)},
+            })
+            return
+
+        self._start_stream()
+        self._event({"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+        }}, "message_start")
+        self._event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for piece in self._stream_pieces(pieces, latency):
+            self._event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}, "content_block_delta")
+        self._event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        self._event({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(pieces)},
+        }, "message_delta")
+        self._event({"type": "message_stop"}, "message_stop")
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI and Anthropic APIs for load testing")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=1.0, help="Median seconds per successful request")
+    parser.add_argument("--latency-dist", choices=["fixed", "lognormal", "exponential"], default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Spread of the lognormal distribution")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of requests that get --tail-latency added")
+    parser.add_argument("--tail-latency", type=float, default=30.0, help="Extra seconds for tail requests")
+    parser.add_argument("--ttft-fraction", type=float, default=0.3, help="Share of the latency spent before the first streamed token")
+    parser.add_argument("--output-tokens", type=int, nargs=2, default=[50, 300], metavar=("MIN", "MAX"), help="Range of completion tokens")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with a 5xx error")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429/503/529 (0 to omit)")
+    parser.add_argument("--error-latency", type=float, default=0.05, help="Maximum seconds before an error response")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Answer 429 beyond this many requests in flight (0 for no limit)")
+    parser.add_argument("--seed", type=int, default=None, help="Makes the fate of the n-th request the same on every run")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args)
+    host, port = server.server_address[:2]
+    print(f"Mock API listening on http://{host}:{port} (OpenAI base URL http://{host}:{port}/v1)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@ setup(
         'tqdm',
         'openai',
         'anthropic',
-        'tenacity',
+        'httpx',
         'huggingface_hub',
         'tiktoken',
         'matplotlib',
@@ -1,26 +1,231 @@
+import asyncio
 import functools
 import hashlib
+import inspect
 import json
 import os
-from typing import Any, Callable
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping, Sequence, Set
+from typing import Any, Callable, Dict, Optional, Tuple
+
+def _normalize(obj: Any) -> Any:
+    # Reduce arguments to a JSON-compatible structure that is identical across processes.
+    # Objects without a natural value (adapters, clients, ...) must define cache_key(); anything
+    # else is rejected, since hashing only its type would let different inputs share a key.
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, bytes):
+        return {"__bytes__": hashlib.sha256(obj).hexdigest()}
+    if isinstance(obj, os.PathLike):
+        return os.fspath(obj)
+    if isinstance(obj, Mapping):
+        return {str(k): _normalize(v) for k, v in sorted(obj.items(), key=lambda item: str(item[0]))}
+    if isinstance(obj, Set):
+        return sorted((_normalize(v) for v in obj), key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(obj, Sequence):
+        return [_normalize(v) for v in obj]
+    if hasattr(obj, "cache_key"):
+        return _normalize(obj.cache_key())
+    raise TypeError(
+        f"Cannot derive a cache key from {type(obj).__module__}.{type(obj).__qualname__}; define cache_key() on it"
+    )
+
+def stable_hash(*parts: Any) -> str:
+    payload = json.dumps(_normalize(parts), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Writes between exact recounts of the store's size. Totals are otherwise tracked per process,
+# which drifts when several processes share the store.
+RECOUNT_INTERVAL = 256
+
+class CacheStore:
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._totals_lock = threading.Lock()
+        self._count: Optional[int] = None
+        self._bytes = 0
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads; WAL lets readers in other
+        # processes proceed while one writer commits, and busy_timeout queues concurrent writers.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode())
+        with self._connection() as conn:
+            bounded = self.max_entries is not None or self.max_bytes is not None
+            previous = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone() if bounded else None
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            if bounded:
+                self._evict(conn, 0 if previous else 1, size - (previous[0] if previous else 0))
+
+    def _recount(self, conn: sqlite3.Connection) -> None:
+        self._count, self._bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def _over_limit(self) -> bool:
+        return (
+            (self.max_entries is not None and self._count > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        )
+
+    def _evict(self, conn: sqlite3.Connection, added_entries: int, added_bytes: int) -> None:
+        # Least recently used entries go first once either bound is exceeded. Running totals keep
+        # the common case free of a table scan; the store is only counted exactly periodically
+        # and when the totals say a bound was crossed.
+        with self._totals_lock:
+            self._writes += 1
+            if self._count is None or self._writes % RECOUNT_INTERVAL == 0:
+                self._recount(conn)
+            else:
+                self._count += added_entries
+                self._bytes += added_bytes
+            if not self._over_limit():
+                return
+            self._recount(conn)
+            excess_entries = self._count - self.max_entries if self.max_entries is not None else 0
+            excess_bytes = self._bytes - self.max_bytes if self.max_bytes is not None else 0
+            if excess_entries <= 0 and excess_bytes <= 0:
+                return
+            evicted = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+                evicted.append((key,))
+                excess_entries -= 1
+                excess_bytes -= size
+                self._count -= 1
+                self._bytes -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+_stores: Dict[Tuple[str, Optional[int], Optional[int]], CacheStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(cache_dir: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> CacheStore:
+    path = os.path.abspath(os.path.join(cache_dir, "cache.sqlite3"))
+    with _stores_lock:
+        key = (path, max_entries, max_bytes)
+        if key not in _stores:
+            _stores[key] = CacheStore(path, max_entries=max_entries, max_bytes=max_bytes)
+        return _stores[key]
+
+def disk_cache(cache_dir: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+    store = get_store(cache_dir, max_entries=max_entries, max_bytes=max_bytes)
 
-def disk_cache(cache_dir: str):
-    os.makedirs(cache_dir, exist_ok=True)
-    
     def decorator(func: Callable):
+        def make_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+            return f"{func.__module__}.{func.__qualname__}:{stable_hash(args, kwargs)}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                key = make_key(args, kwargs)
+                # SQLite may wait on another writer's lock, which must not stall the event loop
+                cached = await asyncio.to_thread(store.get, key)
+                if cached is not None:
+                    return cached["result"]
+                result = await func(*args, **kwargs)
+                await asyncio.to_thread(store.put, key, {"result": result})
+                return result
+            return async_wrapper
+
         @functools.wraps(func)
-        async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            key = hashlib.md5(json.dumps((args, kwargs)).encode()).hexdigest()
-            cache_file = os.path.join(cache_dir, f"{func.__name__}_{key}.json")
-            
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    return json.load(f)
-            
-            result = await func(*args, **kwargs)
-            with open(cache_file, 'w') as f:
-                json.dump(result, f)
-            
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            key = make_key(args, kwargs)
+            cached = store.get(key)
+            if cached is not None:
+                return cached["result"]
+            result = func(*args, **kwargs)
+            store.put(key, {"result": result})
             return result
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+@functools.lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_digest(path: str) -> str:
+    # Memoized on (path, mtime, size) so shared images are hashed once per run
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+class ResponseCache:
+    def __init__(
+        self,
+        cache_dir: str,
+        namespace: str,
+        scope: Dict[str, Any],
+        enabled: bool = True,
+        refresh: bool = False,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        # scope holds everything that makes results from different runs incomparable
+        # (model name, sampling parameters, ...), and is folded into every key.
+        self.namespace = namespace
+        self.scope = scope
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.store = get_store(cache_dir, max_entries=max_entries, max_bytes=max_bytes) if enabled else None
+
+    def key(self, *parts: Any) -> str:
+        return f"{self.namespace}:{stable_hash(self.scope, *parts)}"
+
+    async def image_key(self, text: str, image_path: str) -> str:
+        # Hashing the image file is disk-bound, so it runs off the event loop
+        return self.key(text, await asyncio.to_thread(file_digest, image_path))
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        cached = None if self.refresh else await asyncio.to_thread(self.store.get, key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached["value"]
+
+    async def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.store.put, key, {"value": value})
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+class Checkpoint:
+    def __init__(self, path: str, resume: bool = False, header: Optional[Dict[str, Any]] = None):
+        # Append-only JSONL: one line per finished answer or judgement. Records are written by a
+        # background thread, which fsyncs once per batch of whatever queued up during the previous
+        # fsync, so the event loop never waits on the disk and a crash loses only the last batch.
+        # header (model, generation config, benchmark, judge) is the first line; a checkpoint written
+        # with a different header is moved aside instead of resumed.
+        self.path = path
+        self.header = json.loads(json.dumps(header or {}))
+        self.answers: Dict[Any, str] = {}
+        self.judgements: Dict[Any, Tuple[int, str]] = {}
+        resume = resume and os.path.exists(path) and self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_records, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        if not resume:
+            self._append({"stage": "header", **self.header})
+
+    def _load(self) -> bool:
+        # False if the checkpoint belongs to another configuration and was moved aside
+        header = None
+        answers: Dict[Any, str] = {}
+        judgements: Dict[Any, Tuple[int, str]] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only the last line can be partial, from a write interrupted by the crash
+                    logging.warning(f"Ignoring unreadable line {line_number} in checkpoint {self.path}")
+                    continue
+                if record["stage"] == "header":
+                    header = {k: v for k, v in record.items() if k != "stage"}
+                elif record["stage"] == "answer":
+                    answers[record["question_id"]] = record["answer"]
+                elif record["stage"] == "judgement":
+                    judgements[record["question_id"]] = (record["score"], record["judgement"])
+        if header != self.header:
+            stale = f"{self.path}.stale"
+            os.replace(self.path, stale)
+            changed = sorted(k for k in set(self.header) | set(header or {}) if (header or {}).get(k) != self.header.get(k))
+            logging.warning(
+                f"Checkpoint {self.path} was written with a different {', '.join(changed) if header else 'configuration'}; "
+                f"starting fresh (the old checkpoint was moved to {stale})"
+            )
+            return False
+        self.answers, self.judgements = answers, judgements
+        print(f"Resuming from {self.path}: {len(self.answers)} answers, {len(self.judgements)} judgements")
+        return True
+
+    def _write_records(self) -> None:
+        done = False
+        while not done:
+            batch: List[Optional[Dict[str, Any]]] = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            try:
+                for record in batch:
+                    if record is not None:
+                        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                # Reported by the next write or by close
+                self._error = self._error or e
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(record)
+
+    def write_answer(self, question_id: Any, answer: str) -> None:
+        self.answers[question_id] = answer
+        self._append({"stage": "answer", "question_id": question_id, "answer": answer})
+
+    def write_judgement(self, question_id: Any, score: int, judgement: str) -> None:
+        self.judgements[question_id] = (score, judgement)
+        self._append({"stage": "judgement", "question_id": question_id, "score": score, "judgement": judgement})
+
+    def close(self) -> None:
+        # Blocks until every queued record is on disk
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
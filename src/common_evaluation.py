@@ -1,111 +1,532 @@
+import asyncio
+import contextlib
 import os
 import json
 import logging
-from typing import Dict, Any, List, Tuple
+import time
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
 import wandb
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
 from omegaconf import ListConfig, DictConfig, OmegaConf
 from plugins.base_adapter import BaseAdapter
-from src.llm_judge import LLMJudge
+from src.llm_judge import LLMJudge, join_judge_inputs
+from src.rate_limit import RateLimiter
+from src.caching import ResponseCache
+from src.checkpoint import Checkpoint
+from src.image_cache import load_image
+from src.prefetch import Prefetcher
+from src.dataset_store import DatasetStore, dataset_store_from_config
+from src import metrics, profiling
 
 async def load_questions(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r") as file:
+    with profiling.span("load_questions", path=path), open(path, "r") as file:
         return [json.loads(line) for line in file]
 
 def save_results(results: List[Dict[str, Any]], output_path: str, output_model_name: str) -> None:
     output_file = os.path.join(output_path, f"{output_model_name}_result.jsonl")
-    with open(output_file, "w") as f:
+    with profiling.span("save_results", path=output_file), open(output_file, "w") as f:
         for result in results:
             f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+def make_batches(
+    questions: List[Dict[str, Any]], question_key: str, batch_size: int, image_key: Optional[str] = None
+) -> List[List[int]]:
+    # Group prompts of similar length so each padded batch wastes as few positions as possible.
+    # With image_key, questions about the same image are kept together first, so a vision feature
+    # cache computes each image once. Returns question indices; callers put answers back in the
+    # original order.
+    if image_key:
+        order = sorted(range(len(questions)), key=lambda i: (str(questions[i][image_key]), len(questions[i][question_key])))
+    else:
+        order = sorted(range(len(questions)), key=lambda i: len(questions[i][question_key]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+async def generate_answers(
+    adapter: BaseAdapter,
+    img_root: str,
+    questions: List[Dict[str, Any]],
+    benchmark_config: Dict[str, Any],
+    concurrency: int = 1,
+    batch_size: int = 1,
+    verbose: bool = True,
+    on_answer: Optional[Callable[[int, str], Awaitable[None]]] = None,
+    cache: Optional[ResponseCache] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    group_by_image: bool = False,
+    prefetch_ahead: int = 0,
+    prefetch_workers: int = 4,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> List[str]:
+    image_key = benchmark_config.get('image_key')
+    question_key = benchmark_config.get('question_key')
+
+    if not image_key or not question_key:
+        raise ValueError("image_key and question_key must be specified in the benchmark config")
+
+    # A semaphore passed in is a budget shared with other benchmarks running at the same time
+    if semaphore is None:
+        if concurrency > 1 and not adapter.supports_concurrency:
+            logging.warning(f"{type(adapter).__name__} does not support concurrent calls; falling back to concurrency=1")
+            concurrency = 1
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    answers: List[Optional[str]] = [None] * len(questions)
+    progress = tqdm(total=len(questions))
+
+    async def generate(indices: List[int], position: int) -> None:
+        batch_questions = [questions[i][question_key] for i in indices]
+        image_paths = [os.path.join(img_root, f"{questions[i][image_key]}") for i in indices]
+        # Local models can also be captured with the torch profiler (profiling.torch_steps)
+        generate_profile = (
+            profiling.torch_profile(benchmark_config.get('name', 'generate'))
+            if not adapter.supports_concurrency else contextlib.nullcontext()
+        )
+        # Timings, token counts and retries of this call end up as gen_* fields of each question;
+        # for a batch they describe the whole generate_batch call, except the per-item "rows"
+        with metrics.collect() as item_metrics:
+            queued = time.perf_counter()
+            async with semaphore:
+                started = time.perf_counter()
+                item_metrics["queue_wait"] = started - queued
+                if prefetcher is not None:
+                    await prefetcher.ready(position, position + len(indices))
+                    item_metrics["prefetch_wait"] = time.perf_counter() - started
+                    started = time.perf_counter()
+                with profiling.span("generate", "adapter", batch_size=len(indices)), generate_profile:
+                    if len(indices) == 1:
+                        batch_answers = [await adapter.generate_response(batch_questions[0], image_paths[0])]
+                    else:
+                        batch_answers = await adapter.generate_batch(batch_questions, image_paths)
+                item_metrics["wall_time"] = time.perf_counter() - started
+
+        rows = item_metrics.pop("rows", None) or [{}] * len(indices)
+        for i, question, answer, row in zip(indices, batch_questions, batch_answers, rows):
+            answers[i] = answer
+            questions[i].update({f"gen_{k}": v for k, v in {**item_metrics, **row}.items()})
+            questions[i].update(gen_source="generated", gen_batch_size=len(indices))
+            if cache is not None:
+                await cache.put(cache_keys[i], answer)
+            if checkpoint is not None:
+                checkpoint.write_answer(questions[i].get('question_id', i), answer)
+            if verbose:
+                print(f"### ID: {questions[i].get('question_id', 'N/A')}\n## question: {question}\n## answer: {answer}\n")
+        progress.update(len(indices))
+
+        if on_answer is not None:
+            for i in indices:
+                await on_answer(i, answers[i])
+
+    # Answers already in the checkpoint of an interrupted run, or in the cache from a previous run
+    # with the same model, generation args, question and image, are reused
+    cache_keys: Dict[int, str] = {}
+    pending = []
+    for i, q in enumerate(questions):
+        question_id = q.get('question_id', i)
+        if checkpoint is not None and question_id in checkpoint.answers:
+            answers[i] = checkpoint.answers[question_id]
+            q["gen_source"] = "checkpoint"
+            continue
+        if cache is not None:
+            image_path = os.path.join(img_root, f"{q[image_key]}")
+            cache_keys[i] = await cache.image_key(q[question_key], image_path)
+            answers[i] = await cache.get(cache_keys[i])
+        if answers[i] is None:
+            pending.append(i)
+            continue
+        q["gen_source"] = "cache"
+        if checkpoint is not None:
+            checkpoint.write_answer(question_id, answers[i])
+
+    ready = [i for i in range(len(questions)) if answers[i] is not None]
+
+    async def replay_ready() -> None:
+        progress.update(len(ready))
+        if on_answer is not None:
+            for i in ready:
+                await on_answer(i, answers[i])
+
+    if batch_size > 1 or group_by_image:
+        pending_questions = [questions[i] for i in pending]
+        batches = [
+            [pending[j] for j in batch]
+            for batch in make_batches(pending_questions, question_key, batch_size, image_key if group_by_image else None)
+        ]
+    else:
+        batches = [[i] for i in pending]
+
+    # Images for the next prefetch_ahead items are decoded (and preprocessed, if the adapter
+    # supports it) in background threads while the current item generates
+    prefetcher = None
+    if prefetch_ahead > 0 and pending:
+        prefetcher = Prefetcher(
+            adapter.prefetch_image,
+            [os.path.join(img_root, f"{questions[i][image_key]}") for indices in batches for i in indices],
+            ahead=prefetch_ahead,
+            workers=prefetch_workers,
+        )
+    positions = [0]
+    for indices in batches:
+        positions.append(positions[-1] + len(indices))
+
+    tasks = [asyncio.ensure_future(replay_ready())] + [
+        asyncio.ensure_future(generate(indices, position)) for indices, position in zip(batches, positions)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If one item fails, stop the rest instead of leaving them running in the background
+        for task in tasks:
+            task.cancel()
+        if prefetcher is not None:
+            prefetcher.close()
+        progress.close()
+
+    return answers
+
 async def process_questions(
     adapter: BaseAdapter,
     img_root: str,
     questions: List[Dict[str, Any]],
     benchmark_config: Dict[str, Any],
-    verbose: bool = True
+    verbose: bool = True,
+    concurrency: int = 1,
+    batch_size: int = 1,
+    on_answer: Optional[Callable[[int, str], Awaitable[None]]] = None,
+    cache: Optional[ResponseCache] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    group_by_image: bool = False,
+    prefetch_ahead: int = 0,
+    prefetch_workers: int = 4,
+    semaphore: Optional[asyncio.Semaphore] = None
 ) -> Tuple[List[Dict[str, Any]], wandb.Table]:
     table_columns = benchmark_config.get('table_columns', [])
     if isinstance(table_columns, ListConfig):
         table_columns = list(table_columns)
     
     table = wandb.Table(columns=table_columns)
-    
+
+    answers = await generate_answers(
+        adapter, img_root, questions, benchmark_config, concurrency, batch_size, verbose, on_answer, cache, checkpoint,
+        group_by_image=group_by_image, prefetch_ahead=prefetch_ahead, prefetch_workers=prefetch_workers,
+        semaphore=semaphore,
+    )
+
+    # Results and table rows are assembled in question order, whatever order the answers completed in.
+    # Building a wandb.Image encodes the picture, so the rows are built off the event loop.
     results = []
-    for q in tqdm(questions):
-        image_key = benchmark_config.get('image_key')
-        question_key = benchmark_config.get('question_key')
-        
-        if not image_key or not question_key:
-            raise ValueError("image_key and question_key must be specified in the benchmark config")
-        
-        image_path = os.path.join(img_root, f"{q[image_key]}")
-        question = q[question_key]
-        answer = await adapter.generate_response(question, image_path)
-        
-        if verbose:
-            print(f"### ID: {q.get('question_id', 'N/A')}\n## question: {question}\n## answer: {answer}\n")
-        
+    for q, answer in zip(questions, answers):
         q["answer"] = answer
         results.append(q)
-        
-        table_data = []
-        for column in table_columns:
-            if column == 'benchmark':
-                table_data.append(benchmark_config['name'])
-            elif column == 'image':
-                table_data.append(wandb.Image(Image.open(image_path)))
-            elif column == 'question':
-                table_data.append(question)
-            elif column == 'answer':
-                table_data.append(answer)
-            elif column in q:
-                table_data.append(q[column])
-            else:
-                table_data.append(None)
-        
-        table.add_data(*table_data)
+    rows = await asyncio.to_thread(table_rows, img_root, results, benchmark_config, table_columns)
+    for row in rows:
+        table.add_data(*row)
     
     return results, table
 
-async def evaluate_benchmark(adapter: BaseAdapter, benchmark_name: str) -> None:
-    run = wandb.run
-    config_dict = dict(wandb.config)
-    cfg = OmegaConf.create(config_dict)
-    benchmark_config = cfg.benchmarks[benchmark_name]
+def table_rows(
+    img_root: str,
+    results: List[Dict[str, Any]],
+    benchmark_config: Dict[str, Any],
+    table_columns: List[str]
+) -> List[List[Any]]:
+    rows = []
+    with profiling.span("table_rows", benchmark=benchmark_config['name']):
+        for q in results:
+            image_path = os.path.join(img_root, f"{q[benchmark_config['image_key']]}")
+            table_data = []
+            for column in table_columns:
+                if column == 'benchmark':
+                    table_data.append(benchmark_config['name'])
+                elif column == 'image':
+                    table_data.append(wandb.Image(load_image(image_path)))
+                elif column == 'question':
+                    table_data.append(q[benchmark_config['question_key']])
+                elif column == 'answer':
+                    table_data.append(q["answer"])
+                elif column in q:
+                    table_data.append(q[column])
+                else:
+                    table_data.append(None)
+            rows.append(table_data)
+    return rows
+
+async def judge_answer(
+    llm_judge: LLMJudge,
+    question: Dict[str, Any],
+    record: Optional[Dict[str, Any]],
+    benchmark_config: Dict[str, Any],
+    question_id: Any,
+    checkpoint: Optional[Checkpoint] = None
+) -> Tuple[int, str]:
+    if record is None:
+        # Reported by join_judge_inputs; scored like an unparsable judgement so it is left out of the averages
+        return -1, "Not judged: missing reference answer or context"
+    if checkpoint is not None and question_id in checkpoint.judgements:
+        question["judge_source"] = "checkpoint"
+        return checkpoint.judgements[question_id]
+    # Recorded as judge_* fields of the question, next to its gen_* fields
+    with metrics.collect() as judge_metrics, profiling.span("judge", "judge", question_id=question_id):
+        started = time.perf_counter()
+        score, judgement = await llm_judge.evaluate_response(question, record["reference"], record["context"], benchmark_config)
+        judge_metrics["wall_time"] = time.perf_counter() - started
+    judge_metrics.setdefault("source", "judged")
+    question.update({f"judge_{k}": v for k, v in judge_metrics.items()})
+    if checkpoint is not None:
+        checkpoint.write_judgement(question_id, score, judgement)
+    return score, judgement
+
+async def process_and_judge(
+    adapter: BaseAdapter,
+    llm_judge: LLMJudge,
+    img_root: str,
+    questions: List[Dict[str, Any]],
+    judge_records: List[Optional[Dict[str, Any]]],
+    benchmark_config: Dict[str, Any],
+    verbose: bool = True,
+    concurrency: int = 1,
+    batch_size: int = 1,
+    queue_size: int = 16,
+    judge_workers: int = 8,
+    cache: Optional[ResponseCache] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    group_by_image: bool = False,
+    prefetch_ahead: int = 0,
+    prefetch_workers: int = 4,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    on_generated: Optional[Callable[[], None]] = None
+) -> Tuple[List[Dict[str, Any]], wandb.Table, List[int], List[str]]:
+    # Each answer is handed to the judge as soon as it is generated. The queue is bounded,
+    # so generation waits for the judge once queue_size answers are pending.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    scores: List[Optional[int]] = [None] * len(questions)
+    judgements: List[Optional[str]] = [None] * len(questions)
+
+    async def enqueue(index: int, answer: str) -> None:
+        questions[index]["answer"] = answer
+        await queue.put(index)
+
+    async def judge() -> None:
+        while True:
+            index = await queue.get()
+            if index is None:
+                return
+            scores[index], judgements[index] = await judge_answer(
+                llm_judge, questions[index], judge_records[index], benchmark_config,
+                questions[index].get('question_id', index), checkpoint
+            )
+
+    async def produce() -> Tuple[List[Dict[str, Any]], wandb.Table]:
+        output = await process_questions(
+            adapter, img_root, questions, benchmark_config, verbose, concurrency, batch_size,
+            on_answer=enqueue, cache=cache, checkpoint=checkpoint, group_by_image=group_by_image,
+            prefetch_ahead=prefetch_ahead, prefetch_workers=prefetch_workers, semaphore=semaphore
+        )
+        if on_generated is not None:
+            on_generated()
+        for _ in workers:
+            await queue.put(None)
+        return output
 
-    # Download and prepare data
-    artifact = run.use_artifact(benchmark_config['artifact_path'], type='dataset')
-    data_dir = artifact.download()
+    workers = [asyncio.create_task(judge()) for _ in range(max(1, judge_workers))]
+    producer = asyncio.create_task(produce())
+    try:
+        # A failure in either stage surfaces here; the other stage is cancelled below
+        # instead of blocking forever on the queue.
+        (results, table), *_ = await asyncio.gather(producer, *workers)
+    finally:
+        for task in [producer, *workers]:
+            task.cancel()
+
+    return results, table, scores, judgements
+
+async def download_artifact(run: Any, artifact_path: str, store: Optional[DatasetStore] = None) -> str:
+    with profiling.span("download_artifact", artifact=artifact_path):
+        if store is not None:
+            return await store.fetch(run, artifact_path)
+        artifact = await asyncio.to_thread(run.use_artifact, artifact_path, type='dataset')
+        return await asyncio.to_thread(artifact.download)
+
+async def load_benchmark_data(
+    run: Any, benchmark_config: Dict[str, Any], store: Optional[DatasetStore] = None
+) -> Dict[str, Any]:
+    # Download the dataset and the reference answers in parallel
+    data_dir, ref_dir = await asyncio.gather(
+        download_artifact(run, benchmark_config['artifact_path'], store),
+        download_artifact(run, benchmark_config['reference_path'], store),
+    )
     questions = await load_questions(f"{data_dir}/{benchmark_config['questions_file']}")
     contexts = pd.read_json(f"{data_dir}/{benchmark_config['context_file']}", orient='records', lines=True)
-
-    # Download reference answers
-    ref_artifact = run.use_artifact(benchmark_config['reference_path'], type='dataset')
-    ref_dir = ref_artifact.download()
     references = await load_questions(f"{ref_dir}/{benchmark_config['reference_file']}")
 
+    # Pair each question with its reference answer and image context once, up front
+    judge_records, mismatches = join_judge_inputs(questions, references, contexts, benchmark_config)
+    return {
+        "questions": questions,
+        "judge_records": judge_records,
+        "mismatches": mismatches,
+        "img_root": f"{data_dir}/images",
+    }
+
+async def evaluate_benchmark(
+    adapter: BaseAdapter,
+    benchmark_name: str,
+    adapter_semaphore: Optional[asyncio.Semaphore] = None,
+    limiter: Optional[RateLimiter] = None,
+    run: Optional[Any] = None,
+    data: Optional[Dict[str, Any]] = None,
+    on_generated: Optional[Callable[[], None]] = None,
+    judge_factory: Callable[..., LLMJudge] = LLMJudge
+) -> Dict[str, Any]:
+    # adapter_semaphore and limiter are shared when several benchmarks are evaluated at once.
+    # judge_factory builds the judge from (img_root, limiter=, max_retries=); scripts/bench_pipeline.py
+    # substitutes a mock.
+    # A sweep passes its own run, the data already loaded by load_benchmark_data, and
+    # on_generated, which is called once every answer exists (judging may still be running).
+    # Returns this benchmark's leaderboard columns; the caller merges them into lb_dict.
+    run = run or wandb.run
+    config_dict = dict(run.config)
+    cfg = OmegaConf.create(config_dict)
+    benchmark_config = cfg.benchmarks[benchmark_name]
+
+    if data is None:
+        data = await load_benchmark_data(run, benchmark_config, dataset_store_from_config(cfg.get('dataset_store')))
+    # Answers are written into the question dicts, so each evaluation works on its own copies
+    questions = [dict(q) for q in data["questions"]]
+    judge_records = data["judge_records"]
+    mismatches = data["mismatches"]
+    run.summary[f"{benchmark_config['name']}_judge_join_mismatches"] = {k: len(v) for k, v in mismatches.items()}
+
     # Process questions
-    img_root = f"{data_dir}/images"
-    results, table = await process_questions(adapter, img_root, questions, benchmark_config, verbose=True)
+    img_root = data["img_root"]
+    judge_config = cfg.get('judge', {})
+    if limiter is None:
+        limiter = RateLimiter(
+            requests_per_minute=judge_config.get('requests_per_minute'),
+            tokens_per_minute=judge_config.get('tokens_per_minute'),
+            max_in_flight=judge_config.get('max_in_flight', 8),
+        )
+    llm_judge = judge_factory(img_root, limiter=limiter, max_retries=judge_config.get('max_retries', 5))
+    cache_config = cfg.get('cache', {})
+    max_size_mb = cache_config.get('max_size_mb')
+    cache_options = {
+        "refresh": cache_config.get('refresh', False),
+        "max_entries": cache_config.get('max_entries'),
+        "max_bytes": int(max_size_mb * 1024 * 1024) if max_size_mb else None,
+    }
+    # A disabled cache is not built at all, so no image is hashed for keys nobody reads
+    llm_judge.cache = ResponseCache(
+        cache_config.get('dir', '.cache'),
+        "judge",
+        scope=llm_judge.judge_params(),
+        **cache_options,
+    ) if cache_config.get('judge', True) else None
+    generation_cache = ResponseCache(
+        cache_config.get('dir', '.cache'),
+        "generation",
+        scope={
+            "model": cfg.model.pretrained_model_name_or_path,
+            "generation_args": OmegaConf.to_container(cfg.generation.args, resolve=True),
+        },
+        **cache_options,
+    ) if cache_config.get('generation', False) else None
 
-    # Save results
+    # Answers and judgements are appended to the checkpoint as they complete; with
+    # checkpoint.resume=true an interrupted run continues from the items it already finished
     output_path = f'./{benchmark_config["name"]}_output'
     os.makedirs(output_path, exist_ok=True)
     output_model_name = cfg.model.pretrained_model_name_or_path.split("/")[-1].split(".yml")[0]
-    save_results(results, output_path, output_model_name)
+    checkpoint_config = cfg.get('checkpoint', {})
+    checkpoint = None
+    if checkpoint_config.get('enabled', True):
+        checkpoint = Checkpoint(
+            os.path.join(output_path, f"{output_model_name}_checkpoint.jsonl"),
+            resume=checkpoint_config.get('resume', False),
+            # Answers and judgements from another configuration are never resumed
+            header={
+                "model": cfg.model.pretrained_model_name_or_path,
+                "generation_args": OmegaConf.to_container(cfg.generation.args, resolve=True),
+                "benchmark": benchmark_config['name'],
+                "judge": llm_judge.judge_params(),
+            },
+        )
 
-    # Evaluate with LLM
-    llm_judge = LLMJudge(img_root)
-    scores, judgements = await llm_judge.evaluate_responses(results, references, contexts, benchmark_config)
+    prefetch_config = cfg.generation.get('prefetch', {})
+    try:
+        if judge_config.get('pipeline', False):
+            results, table, scores, judgements = await process_and_judge(
+                adapter, llm_judge, img_root, questions, judge_records, benchmark_config,
+                verbose=True,
+                concurrency=cfg.generation.get('concurrency', 1),
+                batch_size=cfg.generation.get('batch_size', 1),
+                queue_size=judge_config.get('queue_size', 16),
+                judge_workers=judge_config.get('max_in_flight', 8),
+                cache=generation_cache,
+                checkpoint=checkpoint,
+                group_by_image=cfg.generation.get('group_by_image', False),
+                prefetch_ahead=prefetch_config.get('ahead', 0),
+                prefetch_workers=prefetch_config.get('workers', 4),
+                semaphore=adapter_semaphore,
+                on_generated=on_generated,
+            )
+        else:
+            results, table = await process_questions(
+                adapter, img_root, questions, benchmark_config,
+                verbose=True,
+                concurrency=cfg.generation.get('concurrency', 1),
+                batch_size=cfg.generation.get('batch_size', 1),
+                cache=generation_cache,
+                checkpoint=checkpoint,
+                group_by_image=cfg.generation.get('group_by_image', False),
+                prefetch_ahead=prefetch_config.get('ahead', 0),
+                prefetch_workers=prefetch_config.get('workers', 4),
+                semaphore=adapter_semaphore,
+            )
+            if on_generated is not None:
+                on_generated()
+        if generation_cache is not None:
+            print(f"Generation cache for {benchmark_config['name']}: {generation_cache.stats()}")
+            run.summary[f"{benchmark_config['name']}_generation_cache"] = generation_cache.stats()
+        if generation_cache is not None and generation_cache.hits:
+            # With sampling, a reused answer is not a new draw, so the scores are not an independent rerun
+            logging.warning(
+                f"{generation_cache.hits} of {len(questions)} answers for {benchmark_config['name']} were reused "
+                f"from the generation cache in {cache_config.get('dir', '.cache')}, not generated by this run "
+                "(gen_source=cache). Set cache.generation=false or cache.refresh=true to generate them again."
+            )
+
+        # Evaluate with LLM
+        if not judge_config.get('pipeline', False):
+            verdicts = await asyncio.gather(*(
+                judge_answer(llm_judge, q, record, benchmark_config, q.get('question_id', i), checkpoint)
+                for i, (q, record) in enumerate(zip(results, judge_records))
+            ))
+            scores, judgements = zip(*verdicts)
+    finally:
+        # Also when generation or judging fails: the writer thread is a daemon, so records still
+        # queued would otherwise be lost with the interpreter on exactly the crash paths
+        if checkpoint is not None:
+            await asyncio.to_thread(checkpoint.close)
 
     # Convert tuples to lists
     judgements = list(judgements)
     scores = list(scores)
 
-    table.add_column(name="judgement", data=judgements)
-    table.add_column(name="score", data=scores)
+    # Saved after judging so every row carries both its gen_* and judge_* metrics
+    await asyncio.to_thread(save_results, results, output_path, output_model_name)
+    metric_columns = sorted({k for r in results for k in r if k.startswith(("gen_", "judge_"))})
+    # Rows resumed from the checkpoint or served from a cache have no timings. wandb's add_column
+    # rejects a column containing None, so the table is rebuilt row by row instead.
+    table = wandb.Table(
+        columns=list(table.columns) + ["judgement", "score"] + metric_columns,
+        data=[
+            row + [judgement, score] + [r.get(column) for column in metric_columns]
+            for row, judgement, score, r in zip(table.data, judgements, scores, results)
+        ],
+    )
+    item_summary = metrics.percentiles(results, metric_columns)
+    run.summary[f"{benchmark_config['name']}_item_metrics"] = item_summary
+    print(f"Item metrics for {benchmark_config['name']}: {item_summary}")
 
     # Create radar chart data
     radar_df = pd.DataFrame(data=table.data, columns=table.columns)
@@ -116,12 +537,49 @@ async def evaluate_benchmark(adapter: BaseAdapter, benchmark_name: str) -> None:
     data = radar_df.mean(axis=0, numeric_only=True).to_list() + radar_df.score.values.tolist()
     columns = [f"ave_{benchmark_config['name']}"] + [f"{benchmark_config['name']}_{col}" for col in radar_df.index.values.tolist()]
     benchmark_df = pd.DataFrame(data=[data], columns=columns)
-    
-    lb_dict = run.summary.get('lb_dict', {"model_name":cfg.model.pretrained_model_name_or_path})
+
+    # Judge throughput, for tuning the rate limits against the API quota
+    judge_stats = llm_judge.stats_summary()
+    run.summary[f"{benchmark_config['name']}_judge_stats"] = judge_stats
+    print(f"Judge stats for {benchmark_config['name']}: {judge_stats}")
+    if llm_judge.cache is not None:
+        run.summary[f"{benchmark_config['name']}_judge_cache"] = llm_judge.cache.stats()
+        print(f"Judge cache for {benchmark_config['name']}: {llm_judge.cache.stats()}")
+
+    # Log results; serializing the tables writes every image to disk, so it runs off the event loop
+    def log_tables() -> None:
+        with profiling.span("wandb_log", benchmark=benchmark_config['name']):
+            run.log({f"{benchmark_config['name']}_table": table, 
+                     f"{benchmark_config['name']}_radar_table": radar_table,
+                     f"{benchmark_config['name']}_judge_requests": wandb.Table(dataframe=pd.DataFrame(llm_judge.request_stats))})
+    await asyncio.to_thread(log_tables)
+
+    return benchmark_df.iloc[0].to_dict()
+
+def log_leaderboard(run: Any, cfg: DictConfig, benchmark_columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Each benchmark returns its own columns; they are merged here, in config order, and written once
+    lb_dict = {"model_name": cfg.model.pretrained_model_name_or_path}
+    for columns in benchmark_columns:
+        lb_dict.update(columns)
+    run.summary['lb_dict'] = lb_dict
+
+    # Log final results
     lb_df = pd.DataFrame(columns=lb_dict.keys(), data=[lb_dict.values()])
-    combined_df = pd.concat([lb_df, benchmark_df], axis=1)
-    run.summary['lb_dict'] = combined_df.iloc[0].to_dict()
+    if not lb_df.empty:
+        # Create a list of benchmark names
+        benchmark_names = cfg.benchmarks.keys()
+        
+        # Create a dataframe for radar chart
+        radar_df = lb_df.drop(['model_name'] + [f"ave_{name}" for name in benchmark_names], axis=1)
+        radar_df = radar_df.T.reset_index()
+        radar_df.columns = ['category', 'score']
+        
+        # Log to wandb
+        run.log({
+            "lb_table": wandb.Table(dataframe=lb_df),
+            "radar_table": wandb.Table(dataframe=radar_df)
+        })
+    else:
+        print("Warning: lb_df is empty. Cannot log results.")
 
-    # Log results
-    run.log({f"{benchmark_config['name']}_table": table, 
-             f"{benchmark_config['name']}_radar_table": radar_table})
\ No newline at end of file
+    return lb_dict
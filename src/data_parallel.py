@@ -0,0 +1,189 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing as mp
+import queue
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from plugins.base_adapter import BaseAdapter
+from src import metrics
+
+def load_adapter(model_name: str, device: str, config: Dict[str, Any]) -> BaseAdapter:
+    from src.plugin_manager import PluginManager
+    return PluginManager("plugins").get_adapter(model_name, device, config)
+
+def _worker_main(
+    rank: int,
+    model_name: str,
+    device: str,
+    config: Dict[str, Any],
+    vision_cache: Optional[Dict[str, Any]],
+    factory: Callable[[str, str, Dict[str, Any]], BaseAdapter],
+    tasks: Any,
+    results: Any,
+) -> None:
+    # Messages to the parent are (kind, rank, task_id, payload) with kind in ready/result/error
+    try:
+        from src.feature_cache import configure_feature_cache
+        adapter = factory(model_name, device, config)
+        configure_feature_cache(adapter, vision_cache)
+    except Exception as e:
+        results.put(("error", rank, None, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", rank, None, type(adapter).__name__))
+
+    loop = asyncio.new_event_loop()
+    try:
+        # Every worker pulls from the same queue, so a fast device simply takes more items
+        while (task := tasks.get()) is not None:
+            task_id, method, args = task
+            try:
+                with metrics.collect() as item_metrics:
+                    value = loop.run_until_complete(getattr(adapter, method)(*args))
+                results.put(("result", rank, task_id, (value, item_metrics)))
+            except Exception as e:
+                logging.exception(f"Worker {rank} ({device}) failed")
+                results.put(("error", rank, task_id, f"{type(e).__name__}: {e}"))
+    finally:
+        loop.close()
+
+class DataParallelAdapter(BaseAdapter):
+    # Fans generate_response/generate_batch calls out to one adapter per device, each in its own
+    # process. Calls are concurrent from the caller's side, so generation.concurrency should be
+    # at least the number of devices to keep all of them busy.
+    supports_concurrency = True
+
+    def __init__(
+        self,
+        model_name: str,
+        devices: List[str],
+        config: Dict[str, Any],
+        vision_cache: Optional[Dict[str, Any]] = None,
+        factory: Callable[[str, str, Dict[str, Any]], BaseAdapter] = load_adapter,
+    ):
+        super().__init__(model_name, ",".join(devices))
+        self.devices = list(devices)
+        self.config = config
+        # CUDA cannot be initialised in a forked child, so workers are always spawned
+        context = mp.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=_worker_main,
+                args=(rank, model_name, device, config, vision_cache, factory, self.tasks, self.results),
+                daemon=True,
+            )
+            for rank, device in enumerate(self.devices)
+        ]
+        self.task_ids = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.ready: Dict[int, asyncio.Future] = {}
+        self.completed: Counter = Counter()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reader: Optional[threading.Thread] = None
+        self.closing = False
+        # Set once a worker has died; the pool then rejects new work instead of queueing it
+        self.degraded: Optional[str] = None
+
+    @classmethod
+    def supports_model(cls, model_name: str) -> bool:
+        # Never picked by the PluginManager; run_eval creates it when data_parallel.devices is set
+        return False
+
+    async def start(self) -> List[str]:
+        # Starts the workers, which load their models in parallel, and waits until all are ready
+        self.loop = asyncio.get_running_loop()
+        self.ready = {rank: self.loop.create_future() for rank in range(len(self.processes))}
+        for process in self.processes:
+            process.start()
+        self.reader = threading.Thread(target=self._read_results, name="data-parallel-results", daemon=True)
+        self.reader.start()
+        try:
+            return list(await asyncio.gather(*self.ready.values()))
+        except Exception:
+            self.close()
+            raise
+
+    def _read_results(self) -> None:
+        # Runs in a background thread until close(): hands worker messages to the event loop and
+        # notices workers that died without reporting (e.g. killed for running out of memory)
+        reported: set = set()
+        while not self.closing:
+            try:
+                message = self.results.get(timeout=1)
+            except queue.Empty:
+                dead = [rank for rank, p in enumerate(self.processes) if p.exitcode is not None]
+                if set(dead) - reported and not self.closing:
+                    reported.update(dead)
+                    self.loop.call_soon_threadsafe(self._fail_all, f"Data-parallel worker(s) {dead} exited")
+                continue
+            self.loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message: tuple) -> None:
+        kind, rank, task_id, payload = message
+        if task_id is None:
+            future = self.ready.get(rank)
+            if future is not None and not future.done():
+                if kind == "ready":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(f"Worker {rank} ({self.devices[rank]}) failed to start: {payload}"))
+            return
+        future = self.pending.pop(task_id, None)
+        if future is None or future.done():
+            return
+        if kind == "result":
+            self.completed[self.devices[rank] + f"#{rank}"] += 1
+            future.set_result(payload)
+        else:
+            future.set_exception(RuntimeError(f"Worker {rank} ({self.devices[rank]}): {payload}"))
+
+    def _fail_all(self, reason: str) -> None:
+        # The task a dead worker held is unknown, so everything in flight fails. Results that
+        # surviving workers still send for those tasks are dropped by _dispatch.
+        self.degraded = reason
+        for future in list(self.ready.values()) + list(self.pending.values()):
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+        self.pending.clear()
+
+    async def _submit(self, method: str, *args: Any) -> Any:
+        if self.loop is None:
+            raise RuntimeError("DataParallelAdapter.start() must be awaited before generating")
+        if self.degraded is not None:
+            raise RuntimeError(f"Data-parallel pool is degraded: {self.degraded}")
+        task_id = next(self.task_ids)
+        future = self.loop.create_future()
+        self.pending[task_id] = future
+        self.tasks.put((task_id, method, args))
+        value, item_metrics = await future
+        metrics.record(**item_metrics)
+        return value
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        return await self._submit("generate_response", question, image_path)
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        return await self._submit("generate_batch", questions, image_paths)
+
+    async def verify(self) -> bool:
+        return all(process.is_alive() for process in self.processes)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.completed)
+
+    def unload(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.closing = True
+        for process in self.processes:
+            if process.is_alive():
+                self.tasks.put(None)
+        for process in self.processes:
+            if process.pid is not None:
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+MANIFEST_NAME = ".manifest.json"
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _safe_name(artifact_path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", artifact_path)
+
+class DatasetStore:
+    def __init__(self, root: str, offline: bool = False, verify: Union[bool, str] = True, workers: int = 8):
+        # Layout:
+        #   <root>/artifacts/<name>/<digest>/...       files of one artifact version
+        #   <root>/artifacts/<name>/<digest>/.manifest.json   sha256, size and mtime of every file
+        #   <root>/refs/<artifact path>.json           which digest a path such as name:v0 resolved to
+        # Online, only the artifact's metadata is fetched when its digest is already stored.
+        # Offline, wandb is not contacted at all and refs decide what is used.
+        # verify: True compares file sizes and mtimes with the manifest, "full" rehashes every
+        # file, False only checks that the manifest exists.
+        if verify not in (True, False, "full"):
+            raise ValueError(f"dataset_store.verify must be true, false or full, not {verify!r}")
+        self.root = root
+        self.offline = offline
+        self.verify = verify
+        self.workers = workers
+        os.makedirs(os.path.join(root, "artifacts"), exist_ok=True)
+        os.makedirs(os.path.join(root, "refs"), exist_ok=True)
+
+    def _artifact_dir(self, name: str, digest: str) -> str:
+        return os.path.join(self.root, "artifacts", _safe_name(name), digest)
+
+    def _ref_path(self, artifact_path: str) -> str:
+        return os.path.join(self.root, "refs", f"{_safe_name(artifact_path)}.json")
+
+    def _list_files(self, directory: str) -> List[str]:
+        paths = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename != MANIFEST_NAME:
+                    paths.append(os.path.relpath(os.path.join(dirpath, filename), directory))
+        return paths
+
+    def _hash_files(self, directory: str) -> Dict[str, str]:
+        paths = self._list_files(directory)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            digests = executor.map(lambda p: sha256_file(os.path.join(directory, p)), paths)
+            return dict(zip(paths, digests))
+
+    def _stat_files(self, directory: str) -> Dict[str, List[int]]:
+        stats = {}
+        for path in self._list_files(directory):
+            stat = os.stat(os.path.join(directory, path))
+            stats[path] = [stat.st_size, stat.st_mtime_ns]
+        return stats
+
+    def _write_manifest(self, directory: str, name: str, digest: str, files: Dict[str, str]) -> None:
+        with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+            json.dump({"name": name, "digest": digest, "files": files, "stats": self._stat_files(directory)}, f, indent=1)
+
+    def _verified(self, directory: str) -> bool:
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return False
+        if not self.verify:
+            return True
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        # Hashing costs about as much as the download it saves, so by default only files whose
+        # size or mtime changed since they were stored are taken as corrupted
+        if self.verify != "full" and "stats" in manifest:
+            return self._stat_files(directory) == manifest["stats"]
+        if self._hash_files(directory) != manifest["files"]:
+            return False
+        if "stats" not in manifest:
+            # Written before stats were recorded; add them so later runs can skip the rehash
+            self._write_manifest(directory, manifest["name"], manifest["digest"], manifest["files"])
+        return True
+
+    def _store(self, artifact: Any, name: str, digest: str) -> str:
+        # Downloads into a temporary directory inside the store and moves it into place only once
+        # complete, so an interrupted download never looks like a valid entry
+        target = self._artifact_dir(name, digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".download-", dir=os.path.dirname(target))
+        try:
+            artifact.download(root=staging)
+            self._write_manifest(staging, name, digest, self._hash_files(staging))
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return target
+
+    def _resolve_offline(self, artifact_path: str) -> str:
+        ref_path = self._ref_path(artifact_path)
+        if not os.path.exists(ref_path):
+            raise FileNotFoundError(
+                f"{artifact_path} is not in the dataset store at {self.root}; run once online to populate it"
+            )
+        with open(ref_path) as f:
+            ref = json.load(f)
+        directory = self._artifact_dir(ref["name"], ref["digest"])
+        if not self._verified(directory):
+            raise RuntimeError(f"Stored files for {artifact_path} ({ref['digest']}) are missing or corrupted")
+        return directory
+
+    def _resolve_online(self, artifact: Any, artifact_path: str) -> str:
+        name = artifact.name.split(":")[0]
+        directory = self._artifact_dir(name, artifact.digest)
+        if not self._verified(directory):
+            directory = self._store(artifact, name, artifact.digest)
+        with open(self._ref_path(artifact_path), "w") as f:
+            json.dump({"name": name, "digest": artifact.digest}, f)
+        return directory
+
+    async def fetch(self, run: Any, artifact_path: str) -> str:
+        # Returns the local directory holding the artifact's files
+        if self.offline:
+            return await asyncio.to_thread(self._resolve_offline, artifact_path)
+        artifact = await asyncio.to_thread(run.use_artifact, artifact_path, type='dataset')
+        return await asyncio.to_thread(self._resolve_online, artifact, artifact_path)
+
+def dataset_store_from_config(config: Any) -> Optional[DatasetStore]:
+    if not config or not config.get('enabled', False):
+        return None
+    return DatasetStore(
+        config.get('dir', '.datasets'),
+        offline=config.get('offline', False),
+        verify=config.get('verify', True),
+    )
@@ -0,0 +1,212 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+from src.caching import file_digest, stable_hash
+
+# (key, rows) for each image in the call currently being generated, in batch order. Set by
+# FeatureCache.images() around model.generate so the wrapped vision method knows which
+# rows of pixel_values belong to which image.
+_current_images: contextvars.ContextVar[Optional[List[Tuple[str, int]]]] = contextvars.ContextVar(
+    "feature_cache_images", default=None
+)
+
+# images() scopes after which a wrapped method that was never called is reported as not in effect
+WARMUP_SCOPES = 8
+
+def vision_owner(model: Any, method_name: str) -> Optional[Any]:
+    # The object whose method_name the forward pass actually calls. Recent transformers keep the
+    # vision path on the inner base model (model.model) and call it from there; the outer
+    # method, where it exists, only delegates. Older versions have it on the outer model, and
+    # the oldest not at all.
+    inner = getattr(model, "model", None)
+    if inner is not None and callable(getattr(inner, method_name, None)):
+        return inner
+    if callable(getattr(model, method_name, None)):
+        return model
+    return None
+
+class FeatureCache:
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024, disk_dir: Optional[str] = None):
+        # Tensors stay on the device they were computed on while in memory; the optional disk
+        # copy (CPU, one file per image) survives between runs. torch is imported lazily so API-only
+        # runs never load it.
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.scopes = 0
+        self.wrapped_calls = 0
+        self._warned = False
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, namespace: str, image_path: str, *params: Any) -> str:
+        return f"{namespace}:{stable_hash(params, file_digest(image_path))}"
+
+    def _disk_path(self, key: str) -> str:
+        namespace, digest = key.rsplit(":", 1)
+        return os.path.join(self.disk_dir, f"{stable_hash(namespace)[:16]}-{digest}.pt")
+
+    def get(self, key: str, device: Any = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            import torch
+            try:
+                value = torch.load(self._disk_path(key), map_location=device or "cpu", weights_only=True)
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable feature cache file {self._disk_path(key)}: {e}")
+            else:
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        if self.disk_dir:
+            import torch
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            torch.save(value.detach().cpu(), tmp_path)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key: str, value: Any) -> None:
+        size = value.element_size() * value.nelement()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    @contextlib.contextmanager
+    def images(self, namespace: str, image_paths: Sequence[str], rows: Optional[Sequence[int]] = None) -> Iterator[None]:
+        # rows: how many leading-dimension rows of pixel_values each image contributes
+        # (1 per image for LLaVA-style models, the number of tiles for InternVL)
+        rows = rows or [1] * len(image_paths)
+        token = _current_images.set([(self.key(namespace, path), n) for path, n in zip(image_paths, rows)])
+        try:
+            yield
+        finally:
+            _current_images.reset(token)
+            self._check_in_effect()
+
+    def _check_in_effect(self) -> None:
+        # A wrapped method that generate never reaches (e.g. the wrong module for this transformers
+        # version) would otherwise silently never hit
+        with self._lock:
+            self.scopes += 1
+            report = not self._warned and self.scopes >= WARMUP_SCOPES and self.wrapped_calls == 0
+            if report:
+                self._warned = True
+        if report:
+            logging.warning(
+                f"Vision feature cache: the wrapped method was not called in {self.scopes} generate calls; "
+                "the cache is not in effect for this model"
+            )
+
+    def wrap(self, owner: Any, method_name: str) -> bool:
+        # Replaces owner.<method_name>(pixel_values, ...) -> Tensor with a version that only runs the
+        # vision tower on images missing from the cache. Calls made outside images() pass through.
+        original = getattr(owner, method_name, None)
+        if original is None:
+            return False
+        passthrough = False
+
+        @functools.wraps(original)
+        def cached(pixel_values, *args, **kwargs):
+            nonlocal passthrough
+            images = _current_images.get()
+            if images is not None:
+                with self._lock:
+                    self.wrapped_calls += 1
+            if passthrough or images is None or sum(n for _, n in images) != pixel_values.shape[0]:
+                return original(pixel_values, *args, **kwargs)
+            import torch
+
+            features = {}
+            missing: List[int] = []
+            offsets = [0]
+            for _, n in images:
+                offsets.append(offsets[-1] + n)
+            for index, (key, _) in enumerate(images):
+                if key in features:
+                    continue
+                value = self.get(key, device=pixel_values.device)
+                if value is None:
+                    features[key] = None
+                    missing.append(index)
+                else:
+                    features[key] = value
+
+            if missing:
+                computed = original(
+                    torch.cat([pixel_values[offsets[i]:offsets[i + 1]] for i in missing]), *args, **kwargs
+                )
+                if not isinstance(computed, torch.Tensor):
+                    # Some model versions return per-image lists; cache nothing rather than guess the
+                    # layout. A model's output type does not change, so stop trying from here on.
+                    passthrough = True
+                    logging.warning(
+                        f"Vision feature cache: {method_name} returned {type(computed).__name__}, not a Tensor; "
+                        "caching disabled for this model"
+                    )
+                    if len(missing) == len(images):
+                        return computed
+                    return original(pixel_values, *args, **kwargs)
+                start = 0
+                for i in missing:
+                    key, n = images[i]
+                    features[key] = computed[start:start + n]
+                    self.put(key, features[key])
+                    start += n
+            return torch.cat([features[key] for key, _ in images])
+
+        setattr(owner, method_name, cached)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "wrapped_calls": self.wrapped_calls,
+        }
+
+def configure_feature_cache(adapter: Any, config: Any) -> Optional[FeatureCache]:
+    # Builds the cache described by the vision_cache config section and attaches it to the adapter
+    if not config or not config.get('enabled', False):
+        return None
+    cache = FeatureCache(
+        max_bytes=int(config.get('max_size_mb', 1024) * 1024 * 1024),
+        disk_dir=config.get('dir'),
+    )
+    if not adapter.enable_feature_cache(cache):
+        logging.warning(f"{type(adapter).__name__} does not support the vision feature cache; ignoring vision_cache")
+        return None
+    return cache
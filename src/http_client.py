@@ -0,0 +1,53 @@
+import os
+import weakref
+import asyncio
+from typing import Any
+import httpx
+
+# Connections are reused across adapters and the judge, so the pool is sized for
+# the combined generation and judging concurrency rather than per client.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60.0
+TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+# Base URL overrides, read by the OpenAI/Anthropic SDKs and by the adapters that call the APIs directly
+ENDPOINT_ENV = {
+    "openai": "OPENAI_BASE_URL",
+    "anthropic": "ANTHROPIC_BASE_URL",
+}
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.AsyncClient:
+    # httpx connections are bound to the loop that opened them, so keep one pool per running loop
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=TIMEOUT,
+        )
+        _clients[loop] = client
+    return client
+
+async def close_http_client() -> None:
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def configure_endpoints(config: Any) -> None:
+    # Set through the environment so that every client, including those in worker processes,
+    # talks to the same server, e.g. scripts/mock_api_server.py
+    for provider, variable in ENDPOINT_ENV.items():
+        url = (config or {}).get(provider)
+        if url:
+            os.environ[variable] = url.rstrip("/")
+
+def openai_base_url() -> str:
+    return os.environ.get(ENDPOINT_ENV["openai"], DEFAULT_OPENAI_BASE_URL).rstrip("/")
@@ -0,0 +1,103 @@
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+from PIL import Image
+from src import profiling
+
+# Same default as the Anthropic API's 5MB limit on the base64 payload
+DEFAULT_JPEG_MAX_BYTES = 5 * 1024 * 1024 * 3 // 4
+
+class ImageCache:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        # Entries are keyed by (path, mtime, size, variant), so an image rewritten on disk is
+        # never served stale. Least recently used variants are evicted past max_bytes.
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, path: str, variant: Hashable, build: Callable[[], Tuple[Any, int]]) -> Any:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Built outside the lock so other images are not blocked while this one decodes
+        value, size = build()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+        return value
+
+    def raw_bytes(self, path: str) -> bytes:
+        def build() -> Tuple[bytes, int]:
+            with open(path, "rb") as f:
+                data = f.read()
+            return data, len(data)
+        return self._get(path, "raw", build)
+
+    def base64(self, path: str) -> str:
+        def build() -> Tuple[str, int]:
+            encoded = base64.b64encode(self.raw_bytes(path)).decode('utf-8')
+            return encoded, len(encoded)
+        return self._get(path, "base64", build)
+
+    def pil_image(self, path: str) -> Image.Image:
+        # Shared between callers: treat as read-only and use convert()/copy() before modifying
+        def build() -> Tuple[Image.Image, int]:
+            with profiling.span("decode_image", "image", path=path):
+                image = Image.open(io.BytesIO(self.raw_bytes(path)))
+                image.load()
+            return image, image.width * image.height * len(image.getbands())
+        return self._get(path, "pil", build)
+
+    def jpeg_base64(self, path: str, max_bytes: int = DEFAULT_JPEG_MAX_BYTES, quality: int = 85) -> str:
+        # Re-encodes as JPEG, lowering the quality in steps of 5 until the file fits in max_bytes
+        def build() -> Tuple[str, int]:
+            img = self.pil_image(path)
+            with profiling.span("encode_jpeg", "image", path=path):
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                step_quality = quality
+                while True:
+                    buffer = io.BytesIO()
+                    img.save(buffer, format="JPEG", optimize=True, quality=step_quality)
+                    if buffer.tell() <= max_bytes or step_quality <= 10:
+                        break
+                    step_quality -= 5
+            encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            return encoded, len(encoded)
+        return self._get(path, ("jpeg_base64", max_bytes, quality), build)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.current_bytes}
+
+_image_cache: Optional[ImageCache] = None
+
+def get_image_cache() -> ImageCache:
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = ImageCache()
+    return _image_cache
+
+def configure_image_cache(max_bytes: int) -> ImageCache:
+    global _image_cache
+    _image_cache = ImageCache(max_bytes=max_bytes)
+    return _image_cache
+
+def load_image(path: str) -> Image.Image:
+    return get_image_cache().pil_image(path)
@@ -1,57 +1,153 @@
 import asyncio
+import contextlib
 import os
-import base64
-from typing import Dict, Any, List, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from openai import OpenAI, APIError
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from openai import AsyncOpenAI
 import pandas as pd
+from src.caching import ResponseCache
+from src.http_client import get_http_client
+from src.image_cache import get_image_cache
+from src.rate_limit import RateLimiter
+from src import metrics, profiling, resilience
+
+# Rough token cost of one image_url part at default detail, used for tokens-per-minute budgeting
+IMAGE_TOKEN_ESTIMATE = 765
+
+SYSTEM_PROMPT = "You are a helpful assistant that evaluates AI-generated responses."
 
 class LLMJudge:
-    def __init__(self, img_root):
-        self.client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    def __init__(
+        self,
+        img_root,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = 5,
+        cache: Optional[ResponseCache] = None
+    ):
+        # Retries go through the resilience layer so they can be counted and paced by the limiter
+        self.client = AsyncOpenAI(api_key=os.environ['OPENAI_API_KEY'], http_client=get_http_client(), max_retries=0)
         self.img_root = img_root
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.model = "gpt-4o"
+        self.max_tokens = 1000
+        self.temperature = 0.5
+        self.cache = cache
+        self.request_stats: List[Dict[str, Any]] = []
+
+    def judge_params(self) -> Dict[str, Any]:
+        # Everything besides the prompt and image that changes the verdict; used as the cache scope
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "system_prompt": SYSTEM_PROMPT,
+        }
 
     def encode_image(self, image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type(APIError)
-    )
+        return get_image_cache().base64(image_path)
+
     async def evaluate_response(
         self,
         question: Dict[str, Any],
         reference: Dict[str, Any],
-        contexts: pd.DataFrame,
+        context: str,
         benchmark_config: Dict[str, Any]
     ) -> Tuple[int, str]:
 
-        context = contexts.loc[contexts["image"] == question['image'], benchmark_config['context_key']].values[0]
         prompt = self._create_evaluation_prompt(question, reference, context, benchmark_config)
         
         image_path = os.path.join(self.img_root, f"{question[benchmark_config['image_key']]}")
-        base64_image = self.encode_image(image_path)
-
-        response = await asyncio.to_thread(
-            self.client.chat.completions.create,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that evaluates AI-generated responses."},
-                {"role": "user", "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                ]}
-            ],
-            max_tokens=1000,
-            temperature=0.5,
-        )
 
-        evaluation = response.choices[0].message.content
+        if self.cache is not None:
+            cache_key = await self.cache.image_key(prompt, image_path)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                metrics.record(source="cache")
+                score, evaluation = cached
+                return score, evaluation
+
+        base64_image = await asyncio.to_thread(self.encode_image, image_path)
+
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+            ]}
+        ]
+        # Japanese text is close to one token per character, so the prompt length is a safe upper bound
+        estimated_tokens = len(prompt) + IMAGE_TOKEN_ESTIMATE + self.max_tokens
+
+        evaluation, stats = await self._complete(messages, estimated_tokens)
+        self.request_stats.append({"question_id": question.get('question_id'), **stats})
+        metrics.record(**stats)
+
         score = self._extract_score(evaluation)
+        if self.cache is not None:
+            await self.cache.put(cache_key, [score, evaluation])
         return score, evaluation
 
+    async def _complete(self, messages: List[Dict[str, Any]], estimated_tokens: int) -> Tuple[str, Dict[str, Any]]:
+        stats = {"latency": 0.0, "queue_wait": 0.0, "retries": 0, "input_tokens": None, "output_tokens": None, "total_tokens": None}
+        attempt = 0
+
+        @contextlib.asynccontextmanager
+        async def admission() -> AsyncIterator[None]:
+            queued = time.monotonic()
+            async with self.limiter.slot(estimated_tokens):
+                stats["queue_wait"] += time.monotonic() - queued
+                yield
+
+        async def request() -> Any:
+            started = time.monotonic()
+            with profiling.span("judge_request", "judge", attempt=attempt):
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                )
+            stats["latency"] = time.monotonic() - started
+            if response.usage is not None:
+                self.limiter.settle(estimated_tokens, response.usage.total_tokens)
+            return response
+
+        def on_retry(error: BaseException, delay: float) -> None:
+            nonlocal attempt
+            attempt += 1
+            stats["retries"] += 1
+            # A server-side rate limit applies to every judge request, not just this one
+            if resilience.status_code(error) == 429:
+                self.limiter.pause(delay)
+
+        response = await resilience.call_with_retries(
+            request,
+            str(self.client.base_url),
+            policy=resilience.get_policy().with_attempts(self.max_retries + 1),
+            on_retry=on_retry,
+            description="Judge request",
+            admission=admission,
+        )
+        if response.usage is not None:
+            stats["input_tokens"] = response.usage.prompt_tokens
+            stats["output_tokens"] = response.usage.completion_tokens
+            stats["total_tokens"] = response.usage.total_tokens
+        return response.choices[0].message.content, stats
+
+    def stats_summary(self) -> Dict[str, float]:
+        if not self.request_stats:
+            return {}
+        df = pd.DataFrame(self.request_stats)
+        return {
+            "requests": len(df),
+            "retries": int(df["retries"].sum()),
+            "latency_p50": float(df["latency"].quantile(0.5)),
+            "latency_p95": float(df["latency"].quantile(0.95)),
+            "queue_wait_p50": float(df["queue_wait"].quantile(0.5)),
+            "queue_wait_p95": float(df["queue_wait"].quantile(0.95)),
+        }
+
     def _create_evaluation_prompt(self, question, reference, context, benchmark_config):
         return f"""You are a helpful assistant.
         Please act as an impartial judge and evaluate the quality of the response provided by an AI assistant to the user question displayed below. Your evaluation should consider factors such as the helpfulness, relevance, accuracy, depth, creativity, and level of detail of the response. Begin your evaluation by comparing the assistant's answer with the reference answer. Be as objective as possible. The expected language is Japanese. Responses in languages other than Japanese will incur score deductions unless specifically required. Failure to use Japanese at all will result in the lowest evaluation. However, using Japanese is not mandatory when providing only Python scripts or calculation results, where Japanese is not essential. Additionally, your explanation of judgement should be in Japanese. After providing your explanation, you must rate the response on a scale of 1 to 10 by strictly following this format: "[[rating]]", for example: "Rating: [[5]]".
@@ -82,9 +178,55 @@ class LLMJudge:
         contexts: pd.DataFrame,
         benchmark_config: Dict[str, Any]
     ) -> Tuple[List[int], List[str]]:
-        tasks = [
-            self.evaluate_response(q, r, contexts, benchmark_config)
-            for q, r in zip(questions, references)
-        ]
-        results = await asyncio.gather(*tasks)
-        return list(zip(*results))
\ No newline at end of file
+        records, _ = join_judge_inputs(questions, references, contexts, benchmark_config)
+
+        async def evaluate(question: Dict[str, Any], record: Optional[Dict[str, Any]]) -> Tuple[int, str]:
+            if record is None:
+                return -1, "Not judged: missing reference answer or context"
+            return await self.evaluate_response(question, record["reference"], record["context"], benchmark_config)
+
+        results = await asyncio.gather(*(evaluate(q, record) for q, record in zip(questions, records)))
+        return list(zip(*results))
+
+def join_judge_inputs(
+    questions: List[Dict[str, Any]],
+    references: List[Dict[str, Any]],
+    contexts: pd.DataFrame,
+    benchmark_config: Dict[str, Any]
+) -> Tuple[List[Optional[Dict[str, Any]]], Dict[str, List[Any]]]:
+    # Builds the reference and context of every question once per benchmark with hash lookups
+    # on question_id and image. Returns one record per question (None when something is missing)
+    # and the question_ids that could not be matched.
+    image_key = benchmark_config['image_key']
+    context_key = benchmark_config['context_key']
+
+    context_by_image: Dict[Any, str] = {}
+    for image, context in zip(contexts["image"], contexts[context_key]):
+        context_by_image.setdefault(image, context)
+
+    question_ids = [q.get('question_id', i) for i, q in enumerate(questions)]
+    if all('question_id' in r for r in references):
+        reference_by_id: Dict[Any, Dict[str, Any]] = {}
+        for r in references:
+            reference_by_id.setdefault(r['question_id'], r)
+    else:
+        # References without ids can only be paired by position, as they were before
+        print("Warning: references have no question_id; pairing them with questions by position")
+        reference_by_id = dict(zip(question_ids, references))
+
+    mismatches: Dict[str, List[Any]] = {"missing_reference": [], "missing_context": [], "unused_reference": []}
+    records: List[Optional[Dict[str, Any]]] = []
+    for question_id, q in zip(question_ids, questions):
+        reference = reference_by_id.get(question_id)
+        context = context_by_image.get(q[image_key])
+        if reference is None:
+            mismatches["missing_reference"].append(question_id)
+        if context is None:
+            mismatches["missing_context"].append(question_id)
+        records.append({"reference": reference, "context": context} if reference is not None and context is not None else None)
+    mismatches["unused_reference"] = sorted(set(reference_by_id) - set(question_ids), key=str)
+
+    for kind, ids in mismatches.items():
+        if ids:
+            print(f"Warning: {len(ids)} question(s) with {kind.replace('_', ' ')}: {ids[:10]}")
+    return records, mismatches
@@ -0,0 +1,117 @@
+import contextlib
+import contextvars
+import itertools
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import pandas as pd
+
+# Metrics of the generation or judge call currently running in this task. Adapters and the judge
+# add to it with record()/increment(); outside collect() both are no-ops.
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("item_metrics", default=None)
+
+@contextlib.contextmanager
+def collect() -> Iterator[Dict[str, Any]]:
+    values: Dict[str, Any] = {}
+    token = _current.set(values)
+    try:
+        yield values
+    finally:
+        _current.reset(token)
+
+def record(**values: Any) -> None:
+    current = _current.get()
+    if current is not None:
+        current.update(values)
+
+def increment(key: str, amount: float = 1) -> None:
+    current = _current.get()
+    if current is not None:
+        current[key] = current.get(key, 0) + amount
+
+class TimingStreamer:
+    # Passed as `streamer=` to transformers' generate, which calls put() once with the prompt ids
+    # and then once per decoding step with one token per sequence. Records time to first token,
+    # token counts and tokens/sec into the metrics that were current when the streamer was created.
+    # Once a sequence has finished, generate keeps feeding it pad (or eos) tokens; with the ids from
+    # stop_token_ids those are not counted, so each sequence of a batch gets its own token count.
+    def __init__(self, values: Dict[str, Any], stop_token_ids: Iterable[int] = (), pad_token_id: Optional[int] = None):
+        self.values = values
+        self.stop_token_ids = set(stop_token_ids)
+        self.pad_token_id = pad_token_id
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.prompt_seen = False
+        self.input_tokens: List[int] = []
+        self.output_tokens: List[int] = []
+        self.finished: List[bool] = []
+
+    def put(self, value: Any) -> None:
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            prompts = value.tolist() if getattr(value, "ndim", 0) >= 1 else []
+            if prompts and not isinstance(prompts[0], list):
+                prompts = [prompts]
+            # Prompts of a batch are left-padded to the same length
+            self.input_tokens = [sum(1 for t in row if t != self.pad_token_id) for row in prompts]
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        tokens = value.reshape(-1).tolist()
+        if not self.output_tokens:
+            self.output_tokens = [0] * len(tokens)
+            self.finished = [False] * len(tokens)
+        for row, token in enumerate(tokens):
+            if self.finished[row]:
+                continue
+            if token in self.stop_token_ids:
+                self.finished[row] = True
+            else:
+                self.output_tokens[row] += 1
+
+    def end(self) -> None:
+        finished = time.perf_counter()
+        total = sum(self.output_tokens)
+        tokens_per_sec = None
+        if self.first_token is not None:
+            self.values["ttft"] = self.first_token - self.started
+            # Counted from the first token, which is already out when the clock starts
+            if total > len(self.output_tokens) and finished > self.first_token:
+                tokens_per_sec = (total - len(self.output_tokens)) / (finished - self.first_token)
+        if len(self.output_tokens) > 1 or len(self.input_tokens) > 1:
+            # Call-wide totals get their own names; per-sequence counts go to each item
+            self.values["batch_output_tokens"] = total
+            if tokens_per_sec is not None:
+                self.values["batch_tokens_per_sec"] = tokens_per_sec
+            # "rows" holds one dict per item, in batch order; its values replace the call-wide ones
+            self.values["rows"] = [
+                {"input_tokens": input_tokens, "output_tokens": output_tokens}
+                for input_tokens, output_tokens in itertools.zip_longest(self.input_tokens, self.output_tokens)
+            ]
+            return
+        if self.input_tokens:
+            self.values["input_tokens"] = self.input_tokens[0]
+        self.values["output_tokens"] = total
+        if tokens_per_sec is not None:
+            self.values["tokens_per_sec"] = tokens_per_sec
+
+def timing_streamer(tokenizer: Any = None) -> Optional[TimingStreamer]:
+    # tokenizer supplies the pad and eos ids that end a sequence; without it every step counts
+    current = _current.get()
+    if current is None:
+        return None
+    pad_token_id = getattr(tokenizer, "pad_token_id", None)
+    eos_token_id = getattr(tokenizer, "eos_token_id", None)
+    stop_token_ids = [t for t in (pad_token_id, eos_token_id) if t is not None]
+    return TimingStreamer(current, stop_token_ids, pad_token_id)
+
+def percentiles(rows: List[Dict[str, Any]], columns: List[str]) -> Dict[str, float]:
+    # p50/p95/p99 of every numeric column, skipping rows where it is missing
+    df = pd.DataFrame(rows, columns=columns)
+    summary = {}
+    for column in columns:
+        values = pd.to_numeric(df[column], errors="coerce").dropna()
+        if values.empty or df[column].map(lambda v: isinstance(v, bool)).any():
+            continue
+        for q in (50, 95, 99):
+            summary[f"{column}_p{q}"] = float(values.quantile(q / 100))
+    return summary
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional
+import hydra
+from omegaconf import DictConfig, OmegaConf
+from plugins.base_adapter import BaseAdapter
+from src.plugin_manager import PluginManager
+from src.feature_cache import configure_feature_cache
+from src.http_client import configure_endpoints
+from src.resilience import configure_resilience
+from src import metrics
+
+# Answers and batches travel as single JSON lines, well beyond asyncio's 64KB default
+STREAM_LIMIT = 64 * 1024 * 1024
+
+def config_mismatch(served: Dict[str, Any], requested: Optional[Dict[str, Any]]) -> List[str]:
+    # Generation args the client asks for that the worker does not use
+    return sorted(k for k, v in (requested or {}).items() if served.get(k) != v)
+
+class ModelWorker:
+    def __init__(self, adapter: BaseAdapter, generation_args: Dict[str, Any]):
+        self.adapter = adapter
+        self.generation_args = generation_args
+        self.lock = asyncio.Lock()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.dispatch(json.loads(line))
+                except Exception as e:
+                    logging.exception("Request failed")
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except ConnectionResetError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "info":
+            return {
+                "model_name": self.adapter.model_name,
+                "adapter": type(self.adapter).__name__,
+                "supports_concurrency": self.adapter.supports_concurrency,
+                "generation_args": self.generation_args,
+            }
+        if op not in ("generate", "generate_batch"):
+            raise ValueError(f"Unknown op: {op}")
+        if self.adapter.supports_concurrency:
+            # Concurrent requests share one adapter config, so it cannot be swapped per request;
+            # answering with other settings than the client records in its cache keys and checkpoint
+            # would go unnoticed
+            changed = config_mismatch(self.generation_args, request.get("config"))
+            if changed:
+                raise ValueError(
+                    f"{type(self.adapter).__name__} serves requests concurrently and cannot apply the client's "
+                    f"generation args; the worker uses different {', '.join(changed)}. Start the worker with the same generation config."
+                )
+            return await self._generate(op, request)
+        # Local models run one request at a time; the client's generation args are applied for the
+        # duration of the request, so changing them does not require reloading the weights
+        async with self.lock:
+            base_config = getattr(self.adapter, "config", None)
+            if request.get("config") is not None and base_config is not None:
+                self.adapter.config = {**base_config, **request["config"]}
+            try:
+                return await self._generate(op, request)
+            finally:
+                if base_config is not None:
+                    self.adapter.config = base_config
+
+    async def _generate(self, op: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        # Token counts and timings recorded by the adapter travel back with the answer
+        with metrics.collect() as item_metrics:
+            if op == "generate":
+                response = {"answer": await self.adapter.generate_response(request["question"], request["image_path"])}
+            else:
+                response = {"answers": await self.adapter.generate_batch(request["questions"], request["image_paths"])}
+        response["metrics"] = item_metrics
+        return response
+
+class RemoteAdapter(BaseAdapter):
+    # Proxy for an adapter served by `python -m src.model_worker`. Image paths are sent as-is,
+    # so the worker must run on the same machine (or see the same filesystem).
+    dependencies = []
+
+    def __init__(self, model_name: str, device: str, config: Dict[str, Any]):
+        super().__init__(model_name, device)
+        self.config = config
+        self.host, port = device.rsplit(":", 1)
+        self.port = int(port)
+        self.info: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def supports_model(cls, model_name: str) -> bool:
+        # Never picked by the PluginManager; run_eval creates it when worker.attach is set
+        return False
+
+    async def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        # One short-lived connection per request keeps concurrent callers independent
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+        try:
+            writer.write(json.dumps(request, ensure_ascii=False).encode() + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            raise ConnectionError(f"Model worker at {self.device} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Model worker error: {response['error']}")
+        metrics.record(**response.get("metrics", {}))
+        return response
+
+    async def connect(self) -> Dict[str, Any]:
+        self.info = await self._request({"op": "info"})
+        if self.info["model_name"] != self.model_name:
+            raise ValueError(f"Model worker at {self.device} serves {self.info['model_name']}, not {self.model_name}")
+        self.supports_concurrency = self.info["supports_concurrency"]
+        changed = config_mismatch(self.info["generation_args"], self.config) if self.supports_concurrency else []
+        if changed:
+            raise ValueError(
+                f"Model worker at {self.device} runs {self.info['adapter']} with different {', '.join(changed)} "
+                f"and cannot apply this run's generation args"
+            )
+        return self.info
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        response = await self._request({
+            "op": "generate", "question": question, "image_path": image_path, "config": self.config,
+        })
+        return response["answer"]
+
+    async def generate_batch(self, questions: List[str], image_paths: List[str]) -> List[str]:
+        response = await self._request({
+            "op": "generate_batch", "questions": questions, "image_paths": image_paths, "config": self.config,
+        })
+        return response["answers"]
+
+    async def verify(self) -> bool:
+        try:
+            await self.connect()
+            return True
+        except Exception as e:
+            print(f"Verification failed: {str(e)}")
+            return False
+
+async def serve(cfg: DictConfig) -> None:
+    generation_args = OmegaConf.to_container(cfg.generation.args, resolve=True)
+    configure_endpoints(cfg.get('endpoints'))
+    configure_resilience(cfg.get('resilience'))
+    plugin_manager = PluginManager("plugins")
+    adapter = plugin_manager.get_adapter(
+        cfg.model.pretrained_model_name_or_path,
+        f"cuda:{cfg.device_id}",
+        generation_args,
+    )
+    # Features stay warm in the worker across runs, which is where the cache pays off most
+    configure_feature_cache(adapter, cfg.get('vision_cache'))
+    worker = ModelWorker(adapter, generation_args)
+    server = await asyncio.start_server(worker.handle, cfg.worker.host, cfg.worker.port, limit=STREAM_LIMIT)
+    print(f"Serving {adapter.model_name} ({type(adapter).__name__}) on {cfg.worker.host}:{cfg.worker.port}")
+    async with server:
+        await server.serve_forever()
+
+@hydra.main(config_path="../configs", config_name="config", version_base="1.3")
+def main(cfg: DictConfig) -> None:
+    asyncio.run(serve(cfg))
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,154 @@
+import ast
+import copy
 import importlib
+import importlib.util
 import os
-from typing import Dict, Any
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# Import names of adapter dependencies whose distribution name differs from the module name
+DEPENDENCY_MODULES = {
+    'pillow': 'PIL',
+    'google-generativeai': 'google.generativeai',
+}
+
+def dependency_module(requirement: str) -> str:
+    name = re.split(r'[<>=!~\[; ]', requirement, maxsplit=1)[0].strip()
+    return DEPENDENCY_MODULES.get(name.lower(), name.replace('-', '_'))
+
+def missing_dependencies(dependencies: List[str]) -> List[str]:
+    missing = []
+    for requirement in dependencies:
+        try:
+            found = importlib.util.find_spec(dependency_module(requirement)) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            missing.append(requirement)
+    return missing
+
+class AdapterSpec:
+    # Metadata read from an adapter module's source without importing it
+    def __init__(self, name: str, module_name: str, class_name: str, dependencies: List[str],
+                 supports_model: Optional[Callable[[str], bool]]):
+        self.name = name
+        self.module_name = module_name
+        self.class_name = class_name
+        self.dependencies = dependencies
+        self._supports_model = supports_model
+
+    def supports_model(self, model_name: str) -> Optional[bool]:
+        # None means the check could not be evaluated from source alone and needs the real class
+        if self._supports_model is None:
+            return None
+        try:
+            return bool(self._supports_model(model_name))
+        except Exception:
+            return None
+
+def _parse_adapter_source(path: str, module_name: str) -> Optional[AdapterSpec]:
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    registration = None
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'register_plugin':
+            for call in ast.walk(node):
+                if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                        and call.func.attr == 'register_adapter' and len(call.args) == 2
+                        and isinstance(call.args[0], ast.Constant) and isinstance(call.args[1], ast.Name)):
+                    registration = (call.args[0].value, call.args[1].id)
+    if registration is None or registration[1] not in classes:
+        return None
+    name, class_name = registration
+
+    dependencies: List[str] = []
+    supports_model = None
+    for node in classes[class_name].body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == 'dependencies' for t in node.targets):
+            try:
+                dependencies = list(ast.literal_eval(node.value))
+            except ValueError:
+                pass
+        elif isinstance(node, ast.FunctionDef) and node.name == 'supports_model':
+            # supports_model only looks at the model name, so it can be compiled on its own
+            # (without decorators or module imports) and evaluated before the adapter is imported
+            function = copy.copy(node)
+            function.decorator_list = []
+            function.returns = None
+            module = ast.fix_missing_locations(ast.Module(body=[function], type_ignores=[]))
+            namespace: Dict[str, Any] = {}
+            try:
+                exec(compile(module, path, "exec"), {"__builtins__": __builtins__}, namespace)
+                supports_model = lambda model_name, f=namespace[node.name]: f(None, model_name)
+            except Exception:
+                supports_model = None
+    return AdapterSpec(name, module_name, class_name, dependencies, supports_model)
 
 class PluginManager:
     def __init__(self, plugin_dir: str):
         self.plugin_dir = plugin_dir
         self.plugins = {}
-        self.load_plugins()
+        self.specs: Dict[str, AdapterSpec] = {}
+        self.unavailable: Dict[str, str] = {}
+        self.discover_plugins()
 
-    def load_plugins(self):
-        for filename in os.listdir(self.plugin_dir):
+    def discover_plugins(self):
+        # Only reads adapter sources; modules (and torch, transformers, SDKs, ...) are imported
+        # when an adapter is actually selected
+        for filename in sorted(os.listdir(self.plugin_dir)):
             if filename.endswith('_adapter.py'):
+                module_name = f"plugins.{filename[:-3]}"
                 try:
-                    module_name = f"plugins.{filename[:-3]}"
-                    module = importlib.import_module(module_name)
-                    if hasattr(module, 'register_plugin'):
-                        module.register_plugin(self)
-                except  ImportError:
+                    spec = _parse_adapter_source(os.path.join(self.plugin_dir, filename), module_name)
+                except SyntaxError as e:
+                    self.unavailable[module_name] = f"syntax error: {e}"
                     continue
+                # Modules without a register_plugin (base_adapter.py) are not adapters
+                if spec is not None:
+                    self.specs[spec.name] = spec
+
+    def load_plugins(self):
+        for name in self.specs:
+            self._load(name)
+
+    def _load(self, name: str):
+        if name in self.plugins:
+            return self.plugins[name]
+        spec = self.specs[name]
+        try:
+            module = importlib.import_module(spec.module_name)
+        except ImportError as e:
+            missing = missing_dependencies(spec.dependencies)
+            reason = f"missing dependencies: {', '.join(missing)}" if missing else f"import failed: {e}"
+            self.unavailable[name] = reason
+            return None
+        if hasattr(module, 'register_plugin'):
+            module.register_plugin(self)
+        return self.plugins.get(name)
 
     def register_adapter(self, name: str, adapter_class):
         self.plugins[name] = adapter_class
 
+    def availability(self) -> Dict[str, str]:
+        report = {}
+        for name, spec in self.specs.items():
+            if name in self.unavailable:
+                report[name] = self.unavailable[name]
+            else:
+                missing = missing_dependencies(spec.dependencies)
+                report[name] = f"missing dependencies: {', '.join(missing)}" if missing else "available"
+        for module_name, reason in self.unavailable.items():
+            report.setdefault(module_name, reason)
+        return report
+
     def get_adapter(self, model_name: str, device: str, config: Dict[str, Any]):
-        for adapter_class in self.plugins.values():
-            if adapter_class.supports_model(model_name):
+        for name, spec in self.specs.items():
+            if spec.supports_model(model_name) is False:
+                continue
+            adapter_class = self._load(name)
+            if adapter_class is not None and adapter_class.supports_model(model_name):
                 return adapter_class(model_name, device, config)
-        raise ValueError(f"No adapter found for model: {model_name}")
\ No newline at end of file
+        reasons = "\n".join(f"  {name}: {reason}" for name, reason in self.availability().items() if reason != "available")
+        raise ValueError(f"No adapter found for model: {model_name}" + (f"\nUnavailable adapters:\n{reasons}" if reasons else ""))
@@ -0,0 +1,31 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+class Prefetcher:
+    def __init__(self, load: Callable[[str], Any], image_paths: List[str], ahead: int = 8, workers: int = 4):
+        # image_paths is the order in which items will be generated. Loading runs in a thread pool
+        # at most `ahead` items past the one being generated, so decoded images wait in the
+        # (bounded) image cache only briefly before they are used.
+        self.load = load
+        self.image_paths = image_paths
+        self.ahead = ahead
+        self.futures: Dict[int, Future] = {}
+        self.submitted = 0
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+
+    def _submit_until(self, end: int) -> None:
+        end = min(end, len(self.image_paths))
+        while self.submitted < end:
+            self.futures[self.submitted] = self.executor.submit(self.load, self.image_paths[self.submitted])
+            self.submitted += 1
+
+    async def ready(self, start: int, end: int) -> None:
+        # Waits until items [start, end) are loaded and queues the next `ahead` items behind them.
+        # A failed load re-raises here, as it would have in the adapter.
+        self._submit_until(end + self.ahead)
+        for position in range(start, end):
+            await asyncio.wrap_future(self.futures.pop(position))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+class Tracer:
+    def __init__(self, output_dir: str, torch_steps: int = 0):
+        # Spans become Chrome trace "complete" events. Every asyncio task and every thread gets its
+        # own track so that concurrent spans never have to nest; open the file in ui.perfetto.dev
+        # or chrome://tracing.
+        self.output_dir = output_dir
+        self.torch_steps = torch_steps
+        self.torch_traces = 0
+        self.events: List[Dict[str, Any]] = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        # Keyed by the task or thread object itself rather than its id, which is reused once the
+        # object is gone and would put unrelated spans on one row
+        self._task_tracks: "weakref.WeakKeyDictionary[asyncio.Task, int]" = weakref.WeakKeyDictionary()
+        self._thread_tracks = threading.local()
+        self._track_count = 0
+        self._lock = threading.Lock()
+
+    def _new_track(self, name: str) -> int:
+        # Called with self._lock held
+        self._track_count += 1
+        self.events.append({
+            "ph": "M", "name": "thread_name", "pid": self.pid, "tid": self._track_count, "args": {"name": name},
+        })
+        return self._track_count
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        with self._lock:
+            if task is not None:
+                if task not in self._task_tracks:
+                    self._task_tracks[task] = self._new_track(task.get_name())
+                return self._task_tracks[task]
+            if not hasattr(self._thread_tracks, "tid"):
+                self._thread_tracks.tid = self._new_track(threading.current_thread().name)
+            return self._thread_tracks.tid
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, args: Dict[str, Any]) -> Iterator[None]:
+        tid = self._track()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            event = {
+                "ph": "X", "name": name, "cat": category, "pid": self.pid, "tid": tid,
+                "ts": (started - self.origin) * 1e6, "dur": (time.perf_counter() - started) * 1e6,
+                "args": {k: v if isinstance(v, (str, int, float, bool)) or v is None else str(v) for k, v in args.items()},
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def write(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+_tracer: Optional[Tracer] = None
+
+def configure_profiling(config: Any) -> Optional[Tracer]:
+    global _tracer
+    if not config or not config.get('enabled', False):
+        _tracer = None
+        return None
+    _tracer = Tracer(config.get('dir', 'profiles'), torch_steps=config.get('torch_steps', 0))
+    return _tracer
+
+def span(name: str, category: str = "stage", **args: Any) -> ContextManager:
+    # Cheap no-op unless profiling is enabled
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, category, args)
+
+@contextlib.contextmanager
+def torch_profile(name: str) -> Iterator[None]:
+    # Captures a torch profiler trace of the wrapped generate call for the first profiling.torch_steps
+    # calls, written next to the span trace
+    tracer = _tracer
+    if tracer is None or tracer.torch_traces >= tracer.torch_steps:
+        yield
+        return
+    tracer.torch_traces += 1
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    with profile(activities=activities, record_shapes=True, with_stack=True) as profiler:
+        yield
+    os.makedirs(tracer.output_dir, exist_ok=True)
+    profiler.export_chrome_trace(os.path.join(tracer.output_dir, f"torch-{name}-{tracer.torch_traces}.json"))
+
+def write_trace(name: str) -> Optional[str]:
+    if _tracer is None:
+        return None
+    return _tracer.write(os.path.join(_tracer.output_dir, f"trace-{name}.json"))
@@ -0,0 +1,319 @@
+import asyncio
+import contextlib
+import random
+import sys
+import time
+from collections import deque
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+import httpx
+from src.rate_limit import retry_after_seconds
+from src import metrics
+
+T = TypeVar("T")
+
+# Statuses worth another attempt: timeouts, conflicts, rate limits, server errors and
+# Anthropic's 529 overloaded. Any other 4xx means the request itself is wrong.
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit for {endpoint} is open after repeated failures; next attempt in {retry_in:.0f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        max_elapsed: float = 300.0,
+        timeout: Optional[float] = None
+    ):
+        # max_attempts counts the first call; max_elapsed bounds the time one call spends retrying;
+        # timeout is the deadline of a single request, after which it is abandoned and retried
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.timeout = timeout
+
+    def with_attempts(self, max_attempts: int) -> "RetryPolicy":
+        return RetryPolicy(max_attempts, self.base_delay, self.max_delay, self.max_elapsed, self.timeout)
+
+    def delay(self, retry: int, server_hint: Optional[float] = None) -> float:
+        if server_hint is not None:
+            # The server knows best; the jitter only keeps callers it told the same from returning together
+            return server_hint * random.uniform(1.0, 1.1)
+        # Full jitter, so clients that failed together spread out instead of retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+class CircuitBreaker:
+    def __init__(self, endpoint: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        # Opens after failure_threshold consecutive retryable failures. While open no requests are
+        # sent; after reset_timeout one probe request is let through and its outcome decides
+        # whether the circuit closes or stays open for another reset_timeout.
+        self.endpoint = endpoint
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    def acquire(self) -> Tuple[float, bool]:
+        # (seconds to wait before asking again, 0 if a request may be sent now; whether that request
+        # is the probe). The probe's caller passes the flag back, and only its outcome decides
+        # whether an open circuit closes or stays open.
+        if self.opened_at is None:
+            return 0.0, False
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0:
+            return remaining, False
+        if self.probing:
+            return min(1.0, self.reset_timeout), False
+        self.probing = True
+        return 0.0, True
+
+    def release(self, probe: bool) -> None:
+        # The request ended without saying anything about the endpoint (abandoned, or rejected)
+        if probe:
+            self.probing = False
+
+    def success(self, probe: bool) -> None:
+        # Requests sent before the circuit opened say nothing about whether it recovered since
+        if self.opened_at is not None and not probe:
+            return
+        if self.opened_at is not None:
+            print(f"Circuit for {self.endpoint} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self, probe: bool) -> None:
+        if probe:
+            self.opened_at = time.monotonic()
+            self.probing = False
+            return
+        if self.opened_at is not None:
+            return
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            print(f"Circuit for {self.endpoint} opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+class Hedger:
+    def __init__(self, quantile: float = 0.95, budget: float = 0.05, min_samples: int = 20, window: int = 200):
+        # Sends a duplicate of a request that has been running longer than the given quantile of
+        # recent latencies, and uses whichever answers first. At most `budget` extra requests per
+        # request are sent, so the added cost is bounded even when the tail gets long.
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+
+    def observe(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        # None until there are enough samples to know what slow means
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    def try_acquire(self) -> bool:
+        if self.hedges + 1 > self.budget * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+_policy = RetryPolicy()
+_breaker_settings: Dict[str, Any] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_hedge_settings: Optional[Dict[str, Any]] = None
+_hedgers: Dict[Tuple[str, str], Hedger] = {}
+
+def configure_resilience(config: Any) -> RetryPolicy:
+    global _policy, _breaker_settings, _hedge_settings
+    config = config or {}
+    _policy = RetryPolicy(
+        max_attempts=config.get('max_attempts', 6),
+        base_delay=config.get('base_delay', 1.0),
+        max_delay=config.get('max_delay', 30.0),
+        max_elapsed=config.get('max_elapsed', 300.0),
+        timeout=config.get('timeout'),
+    )
+    _breaker_settings = {
+        "failure_threshold": config.get('breaker_threshold', 5),
+        "reset_timeout": config.get('breaker_reset', 30.0),
+    }
+    hedging = config.get('hedging') or {}
+    _hedge_settings = {
+        "quantile": hedging.get('quantile', 0.95),
+        "budget": hedging.get('budget', 0.05),
+        "min_samples": hedging.get('min_samples', 20),
+    } if hedging.get('enabled', False) else None
+    _breakers.clear()
+    _hedgers.clear()
+    return _policy
+
+def get_policy() -> RetryPolicy:
+    return _policy
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    # One breaker per endpoint, shared by every adapter and judge that calls it
+    endpoint = endpoint.rstrip("/")
+    if endpoint not in _breakers:
+        _breakers[endpoint] = CircuitBreaker(endpoint, **_breaker_settings)
+    return _breakers[endpoint]
+
+def get_hedger(endpoint: str, operation: str) -> Optional[Hedger]:
+    # Latencies are tracked per endpoint and operation, since e.g. judging and answer generation
+    # against the same API take very different times
+    if _hedge_settings is None:
+        return None
+    key = (endpoint.rstrip("/"), operation)
+    if key not in _hedgers:
+        _hedgers[key] = Hedger(**_hedge_settings)
+    return _hedgers[key]
+
+def _connection_errors() -> Tuple[type, ...]:
+    errors = [httpx.TransportError, ConnectionError, TimeoutError, asyncio.TimeoutError]
+    # The SDKs wrap transport failures in their own types. Only SDKs that are already loaded can
+    # have raised one, and importing one here would stall the event loop.
+    for module_name in ("openai", "anthropic"):
+        error_type = getattr(sys.modules.get(module_name), "APIConnectionError", None)
+        if error_type is not None:
+            errors.append(error_type)
+    return tuple(errors)
+
+def status_code(error: BaseException) -> Optional[int]:
+    # HTTP status of a failed call from the OpenAI/Anthropic SDKs, httpx or google.api_core
+    for value in (
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+        getattr(error, "code", None),
+    ):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+def classify(error: BaseException) -> Tuple[bool, Optional[float]]:
+    # (retryable, seconds the server asked us to wait)
+    status = status_code(error)
+    if status is not None:
+        retryable = status in RETRYABLE_STATUSES or status >= 500
+        return retryable, retry_after_seconds(getattr(getattr(error, "response", None), "headers", None))
+    return isinstance(error, _connection_errors()), None
+
+async def _hedged(
+    call: Callable[[], Awaitable[T]],
+    timeout: Optional[float],
+    hedger: Optional[Hedger],
+    admission: Optional[Callable[[], AsyncContextManager]],
+) -> T:
+    # One attempt: the request, plus possibly a hedge. Deadlines and hedge delays are measured from
+    # when a request is admitted, so waiting for a rate limiter slot never counts as slowness.
+    admitted = asyncio.Event()
+
+    async def request(primary: bool) -> T:
+        async with admission() if admission is not None else contextlib.nullcontext():
+            if primary:
+                admitted.set()
+            started = time.monotonic()
+            try:
+                result = await (asyncio.wait_for(call(), timeout) if timeout else call())
+            except asyncio.TimeoutError:
+                metrics.increment("timeouts")
+                raise
+            if hedger is not None:
+                hedger.observe(time.monotonic() - started)
+            return result
+
+    primary = asyncio.ensure_future(request(True))
+    tasks = [primary]
+    try:
+        if hedger is not None:
+            hedger.requests += 1
+            delay = hedger.delay()
+            if delay is not None:
+                admission_wait = asyncio.ensure_future(admitted.wait())
+                await asyncio.wait([primary, admission_wait], return_when=asyncio.FIRST_COMPLETED)
+                admission_wait.cancel()
+                if not primary.done():
+                    await asyncio.wait([primary], timeout=delay)
+                    if not primary.done() and hedger.try_acquire():
+                        tasks.append(asyncio.ensure_future(request(False)))
+                        metrics.increment("hedges")
+
+        error: Optional[BaseException] = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        metrics.increment("hedge_wins")
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Mark a losing request's error as retrieved
+                task.exception()
+
+async def call_with_retries(
+    call: Callable[[], Awaitable[T]],
+    endpoint: str,
+    policy: Optional[RetryPolicy] = None,
+    on_retry: Optional[Callable[[BaseException, float], None]] = None,
+    description: str = "Request",
+    admission: Optional[Callable[[], AsyncContextManager]] = None,
+) -> T:
+    # Runs call() until it succeeds, fails with a non-retryable error or the policy is exhausted.
+    # Each request gets the policy's deadline and, if hedging is enabled, may be duplicated.
+    # admission, e.g. a rate limiter slot, is entered around every request including hedges.
+    # Retries are counted in the current item metrics; on_retry(error, delay) sees each one first.
+    policy = policy or _policy
+    breaker = get_breaker(endpoint)
+    hedger = get_hedger(endpoint, description)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        wait, probe = breaker.acquire()
+        if wait > 0:
+            if time.monotonic() - started + wait > policy.max_elapsed:
+                raise CircuitOpenError(breaker.endpoint, wait)
+            await asyncio.sleep(wait)
+            continue
+        try:
+            result = await _hedged(call, policy.timeout, hedger, admission)
+        except Exception as error:
+            retryable, server_hint = classify(error)
+            # Only availability counts against the endpoint; a rejected request says nothing about it
+            if retryable:
+                breaker.failure(probe)
+            else:
+                breaker.release(probe)
+            attempt += 1
+            if not retryable or attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt - 1, server_hint)
+            if time.monotonic() - started + delay > policy.max_elapsed:
+                raise
+            metrics.increment("retries")
+            if on_retry is not None:
+                on_retry(error, delay)
+            print(f"{description} failed ({type(error).__name__}). Retrying in {delay:.1f} seconds. (Attempt {attempt}/{policy.max_attempts - 1})")
+            await asyncio.sleep(delay)
+        except BaseException:
+            breaker.release(probe)
+            raise
+        else:
+            breaker.success(probe)
+            return result
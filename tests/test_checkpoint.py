@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+import os
+import pytest
+from scripts.bench_pipeline import BENCHMARK_NAME, LocalRun, MockAdapter, MockJudge, make_config, make_dataset
+from src.common_evaluation import evaluate_benchmark
+
+ITEMS = 10
+
+class CountingAdapter(MockAdapter):
+    def __init__(self, fail_after=None):
+        super().__init__(latency=0, blocking=False, batch_item_cost=0)
+        self.fail_after = fail_after
+        self.questions = []
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        if self.fail_after is not None and len(self.questions) >= self.fail_after:
+            raise RuntimeError("interrupted")
+        self.questions.append(question)
+        return await super().generate_response(question, image_path)
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    # evaluate_benchmark writes <benchmark>_output/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    make_dataset(str(tmp_path), ITEMS, 3, seed=0)
+    return tmp_path
+
+def evaluate(root, adapter, resume: bool, temperature: float = 0.7):
+    args = argparse.Namespace(batch_size=1, pipeline=False, judge_concurrency=4)
+    config = make_config(args, concurrency=1)
+    config["checkpoint"]["resume"] = resume
+    config["generation"]["args"]["temperature"] = temperature
+    config["generation"]["prefetch"]["ahead"] = 0
+    run = LocalRun(config, {"local/data": str(root / "data"), "local/reference": str(root / "reference")})
+    return asyncio.run(evaluate_benchmark(adapter, BENCHMARK_NAME, run=run, judge_factory=MockJudge))
+
+def checkpoint_records(root):
+    path = root / f"{BENCHMARK_NAME}_output" / "mock-model_checkpoint.jsonl"
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_interrupted_run_resumes_from_checkpoint(dataset):
+    with pytest.raises(RuntimeError, match="interrupted"):
+        evaluate(dataset, CountingAdapter(fail_after=4), resume=False)
+    # The checkpoint is drained on the failure path too
+    records = checkpoint_records(dataset)
+    assert records[0]["stage"] == "header"
+    finished = {r["question_id"] for r in records if r["stage"] == "answer"}
+    assert len(finished) == 4
+
+    adapter = CountingAdapter()
+    evaluate(dataset, adapter, resume=True)
+    assert len(adapter.questions) == ITEMS - len(finished)
+    records = checkpoint_records(dataset)
+    assert {r["question_id"] for r in records if r["stage"] == "answer"} == set(range(ITEMS))
+    assert len([r for r in records if r["stage"] == "judgement"]) == ITEMS
+
+def test_header_mismatch_starts_fresh(dataset):
+    evaluate(dataset, CountingAdapter(), resume=False)
+    adapter = CountingAdapter()
+    evaluate(dataset, adapter, resume=True, temperature=0.2)
+    # Answers sampled with another temperature are not reused
+    assert len(adapter.questions) == ITEMS
+    stale = dataset / f"{BENCHMARK_NAME}_output" / "mock-model_checkpoint.jsonl.stale"
+    assert os.path.exists(stale)
+    assert checkpoint_records(dataset)[0]["generation_args"]["temperature"] == 0.2
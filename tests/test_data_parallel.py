@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict
+import pytest
+from plugins.base_adapter import BaseAdapter
+from src.data_parallel import DataParallelAdapter
+
+# CPU stand-in for a model: spawned workers import this module to build it, so it needs no GPU
+
+class StubAdapter(BaseAdapter):
+    def __init__(self, model_name: str, device: str, config: Dict[str, Any]):
+        super().__init__(model_name, device)
+        self.latency = config.get("latency", {}).get(device, 0.01)
+
+    @classmethod
+    def supports_model(cls, model_name: str) -> bool:
+        return model_name == "stub"
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        if question == "crash":
+            os._exit(1)
+        time.sleep(self.latency)
+        return f"{self.device}:{question}"
+
+    async def verify(self) -> bool:
+        return True
+
+def stub_factory(model_name: str, device: str, config: Dict[str, Any]) -> BaseAdapter:
+    return StubAdapter(model_name, device, config)
+
+async def _generate(adapter: DataParallelAdapter, questions):
+    return await asyncio.gather(*(adapter.generate_response(q, "image.png") for q in questions))
+
+def test_faster_worker_takes_more_items():
+    async def main():
+        adapter = DataParallelAdapter(
+            "stub", ["cpu:0", "cpu:1"], {"latency": {"cpu:0": 0.2, "cpu:1": 0.01}}, factory=stub_factory
+        )
+        try:
+            assert await adapter.start() == ["StubAdapter", "StubAdapter"]
+            questions = [f"q{i}" for i in range(40)]
+            answers = await asyncio.wait_for(_generate(adapter, questions), timeout=60)
+        finally:
+            adapter.close()
+        assert [answer.split(":", 2)[2] for answer in answers] == questions
+        stats = adapter.stats()
+        assert sum(stats.values()) == len(questions)
+        assert stats["cpu:1#1"] > stats.get("cpu:0#0", 0)
+
+    asyncio.run(main())
+
+def test_dead_worker_fails_pending_and_rejects_new_work():
+    async def main():
+        adapter = DataParallelAdapter("stub", ["cpu:0", "cpu:1"], {"latency": {"cpu:0": 0.05, "cpu:1": 0.05}}, factory=stub_factory)
+        try:
+            await adapter.start()
+            # Nothing may hang: in-flight calls fail once the dead worker is noticed
+            results = await asyncio.wait_for(
+                asyncio.gather(*(adapter.generate_response(q, "image.png") for q in ["crash"] + [f"q{i}" for i in range(20)]), return_exceptions=True),
+                timeout=30,
+            )
+            assert any(isinstance(r, RuntimeError) for r in results)
+            assert adapter.degraded is not None
+            with pytest.raises(RuntimeError, match="degraded"):
+                await asyncio.wait_for(adapter.generate_response("late", "image.png"), timeout=5)
+            assert not await adapter.verify()
+        finally:
+            adapter.close()
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from src import metrics
+
+PAD, EOS = 0, 2
+
+class Ids:
+    # The parts of a torch tensor the streamer uses
+    def __init__(self, values):
+        self.values = values
+        self.ndim = 2 if values and isinstance(values[0], list) else 1
+
+    def tolist(self):
+        return self.values
+
+    def reshape(self, *shape):
+        return Ids([v for row in self.values for v in row] if self.ndim == 2 else list(self.values))
+
+def stream(prompt, steps):
+    tokenizer = SimpleNamespace(pad_token_id=PAD, eos_token_id=EOS)
+    with metrics.collect() as values:
+        streamer = metrics.timing_streamer(tokenizer)
+        streamer.put(Ids(prompt))
+        for step in steps:
+            streamer.put(Ids(step))
+        streamer.end()
+    return values
+
+def test_single_sequence_counts_tokens_until_eos():
+    values = stream([[5, 6, 7]], [[8], [9], [EOS]])
+    assert values["input_tokens"] == 3
+    assert values["output_tokens"] == 2
+    assert "rows" not in values
+
+def test_batch_counts_each_sequence():
+    # Left-padded prompts; the first sequence finishes after one token and is then fed pad tokens
+    values = stream(
+        [[PAD, PAD, 5], [5, 6, 7]],
+        [[8, 8], [EOS, 9], [PAD, 9], [PAD, 9], [PAD, EOS]],
+    )
+    assert values["rows"] == [{"input_tokens": 1, "output_tokens": 1}, {"input_tokens": 3, "output_tokens": 4}]
+    assert values["batch_output_tokens"] == 5
+    assert "output_tokens" not in values
+
+def test_no_metrics_outside_collect():
+    assert metrics.timing_streamer() is None
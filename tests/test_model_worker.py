@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Dict
+import pytest
+from plugins.base_adapter import BaseAdapter
+from src.model_worker import ModelWorker
+
+ARGS = {"max_length": 256, "temperature": 0.7}
+
+class ConfigEchoAdapter(BaseAdapter):
+    def __init__(self, config: Dict[str, Any], supports_concurrency: bool):
+        super().__init__("echo", "cpu")
+        self.config = config
+        self.supports_concurrency = supports_concurrency
+
+    @classmethod
+    def supports_model(cls, model_name: str) -> bool:
+        return False
+
+    async def generate_response(self, question: str, image_path: str) -> str:
+        return str(self.config["temperature"])
+
+    async def verify(self) -> bool:
+        return True
+
+def generate(worker: ModelWorker, config: Dict[str, Any]) -> Dict[str, Any]:
+    request = {"op": "generate", "question": "q", "image_path": "image.png", "config": config}
+    return asyncio.run(worker.dispatch(request))
+
+def test_local_adapter_applies_request_config():
+    adapter = ConfigEchoAdapter(dict(ARGS), supports_concurrency=False)
+    worker = ModelWorker(adapter, dict(ARGS))
+    assert generate(worker, {**ARGS, "temperature": 0.2})["answer"] == "0.2"
+    assert adapter.config == ARGS
+
+def test_concurrent_adapter_rejects_other_generation_args():
+    worker = ModelWorker(ConfigEchoAdapter(dict(ARGS), supports_concurrency=True), dict(ARGS))
+    assert generate(worker, dict(ARGS))["answer"] == "0.7"
+    with pytest.raises(ValueError, match="temperature"):
+        generate(worker, {**ARGS, "temperature": 0.2})
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from src import resilience
+from src.resilience import CircuitBreaker, Hedger, RetryPolicy, call_with_retries, configure_resilience, get_breaker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def open_breaker(threshold: int = 3) -> CircuitBreaker:
+    breaker = CircuitBreaker("api.example", failure_threshold=threshold, reset_timeout=30)
+    for _ in range(threshold):
+        assert breaker.acquire() == (0.0, False)
+        breaker.failure(False)
+    return breaker
+
+def test_opens_at_threshold(clock):
+    breaker = CircuitBreaker("api.example", failure_threshold=3, reset_timeout=30)
+    breaker.failure(False)
+    breaker.failure(False)
+    assert breaker.acquire() == (0.0, False)
+    breaker.success(False)
+    breaker.failure(False)
+    breaker.failure(False)
+    # The success in between reset the count
+    assert breaker.acquire() == (0.0, False)
+    breaker.failure(False)
+    wait, probe = breaker.acquire()
+    assert wait == pytest.approx(30) and not probe
+
+def test_lets_through_a_single_probe(clock):
+    breaker = open_breaker()
+    clock.now += 31
+    assert breaker.acquire() == (0.0, True)
+    # Requests that started before the circuit opened finish late; none of them frees the probe
+    breaker.failure(False)
+    breaker.release(False)
+    breaker.success(False)
+    wait, probe = breaker.acquire()
+    assert wait > 0 and not probe
+    assert breaker.opened_at is not None
+
+def test_probe_outcome_decides(clock):
+    breaker = open_breaker()
+    clock.now += 31
+    assert breaker.acquire() == (0.0, True)
+    breaker.failure(True)
+    # Open again for a full reset_timeout from the failed probe
+    wait, probe = breaker.acquire()
+    assert wait == pytest.approx(30) and not probe
+
+    clock.now += 31
+    assert breaker.acquire() == (0.0, True)
+    breaker.release(True)
+    # An abandoned probe lets the next caller probe instead
+    assert breaker.acquire() == (0.0, True)
+    breaker.success(True)
+    assert breaker.acquire() == (0.0, False)
+    assert breaker.failures == 0
+
+def test_backoff_delays():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+    for retry in range(6):
+        for _ in range(50):
+            assert 0 <= policy.delay(retry) <= min(8.0, 2 ** retry)
+    for _ in range(50):
+        assert 5.0 <= policy.delay(0, server_hint=5.0) <= 5.5
+
+def test_hedging_budget():
+    hedger = Hedger(budget=0.1, min_samples=3)
+    assert hedger.delay() is None
+    for latency in (0.1, 0.2, 0.3):
+        hedger.observe(latency)
+    assert hedger.delay() == 0.3
+    hedger.requests = 20
+    assert hedger.try_acquire()
+    assert hedger.try_acquire()
+    assert not hedger.try_acquire()
+
+def test_retries_and_breaker_accounting():
+    configure_resilience({"breaker_threshold": 5})
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+    outcomes = [StatusError(503), StatusError(503), "ok"]
+
+    async def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def rejected():
+        raise StatusError(400)
+
+    async def main():
+        assert await call_with_retries(call, "retry.example", policy) == "ok"
+        breaker = get_breaker("rejected.example")
+        breaker.failure(False)
+        breaker.failure(False)
+        with pytest.raises(StatusError):
+            await call_with_retries(rejected, "rejected.example", policy)
+        # A rejected request is not retried and says nothing about availability
+        assert breaker.failures == 2
+
+    asyncio.run(main())
+    configure_resilience(None)